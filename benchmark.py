@@ -0,0 +1,426 @@
+import argparse
+import ast
+import gc
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from user_analysis import ALERTS_THRESHOLD, LOGIN_ATTEMPTS_THRESHOLD, TRUSTED_BROWSERS, WATCHED_IPS
+
+# --- Synthetic workloads ---
+
+# Peak memory changes below this many bytes are noise, not regressions
+MEMORY_SLACK_BYTES = 64 * 1024
+SUSPICIOUS_KINDS = ('stale_login', 'untrusted_browser', 'vpn_tag', 'global_delete', 'failed_login_with_alerts')
+
+
+def _random_ip(rng):
+    return f"172.16.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+
+
+def _action(rng, kind=None):
+    """A recent action; the default kinds never trigger a rule on their own."""
+    if kind == 'global_delete':
+        return {'type': 'delete', 'scope': 'global', 'success': True}
+    if kind == 'failed_login':
+        return {'type': 'login', 'scope': 'local', 'success': False}
+    return rng.choice(({'type': 'view', 'scope': 'global', 'success': True},
+                       {'type': 'delete', 'scope': 'local', 'success': True},
+                       {'type': 'login', 'scope': 'local', 'success': True}))
+
+
+def generate_users(count, suspicious_ratio=0.1, actions_per_user=3, seed=0):
+    """
+    Generates a seeded population of user dicts for analyze_user_behavior.
+
+    Args:
+        count (int): Number of users.
+        suspicious_ratio (float): Share of users built to trip one of the rules
+            (each such user is flagged at least once; the rest are never flagged).
+        actions_per_user (int): Length of every user's recent_actions list.
+        seed (int): Random seed, the same seed always gives the same population.
+
+    Returns:
+        list: User dicts with an integer 'id'.
+    """
+    rng = random.Random(seed)
+    users = []
+    for user_id in range(count):
+        user = {
+            'id': user_id,
+            'login_attempts': rng.randint(0, LOGIN_ATTEMPTS_THRESHOLD),
+            'ip': _random_ip(rng),
+            'location': rng.choice(('home', 'office', 'travel')),
+            'last_login_time': f"2025-07-{rng.randint(20, 31):02d}",
+            'account_status': rng.choice(('active', 'inactive')),
+            'browser': rng.choice(TRUSTED_BROWSERS),
+            'access_level': rng.randint(0, 9),
+            'downloads': rng.randint(0, 200),
+            'shared_links': rng.randint(0, 20),
+            'alerts': rng.randint(0, 5),
+            'tags': [],
+            'recent_actions': [_action(rng) for _ in range(actions_per_user)],
+        }
+        if rng.random() < suspicious_ratio:
+            kind = rng.choice(SUSPICIOUS_KINDS)
+            if kind in ('global_delete', 'failed_login_with_alerts') and actions_per_user:
+                user['account_status'] = 'active'
+                if kind == 'global_delete':
+                    user['recent_actions'][rng.randrange(actions_per_user)] = _action(rng, 'global_delete')
+                else:
+                    user['alerts'] = rng.randint(ALERTS_THRESHOLD + 1, 9)
+                    user['recent_actions'][rng.randrange(actions_per_user)] = _action(rng, 'failed_login')
+            else:
+                # The login rules only apply to watched users that are away from home
+                if rng.random() < 0.5:
+                    user['login_attempts'] = rng.randint(LOGIN_ATTEMPTS_THRESHOLD + 1, 20)
+                else:
+                    user['ip'] = rng.choice(WATCHED_IPS)
+                user['location'] = rng.choice(('office', 'travel'))
+                user['account_status'] = 'active'
+                if kind == 'untrusted_browser':
+                    user['browser'] = rng.choice(('Edge', 'Safari', 'Opera'))
+                elif kind == 'vpn_tag':
+                    user['tags'] = ['vpn']
+                else:
+                    user['last_login_time'] = f"2025-06-{rng.randint(1, 30):02d}"
+        users.append(user)
+    return users
+
+
+def _generate_block(rng, depth, budget, indent, lines):
+    """Appends a block of statements to `lines`, drawing from `budget` (a one-item list)."""
+    pad = '    ' * indent
+    emitted = 0
+    # A block always gets at least one statement, even when the budget is spent
+    while emitted == 0 or (budget[0] > 0 and rng.random() < 0.8):
+        budget[0] -= 1
+        emitted += 1
+        choice = rng.random() if depth > 0 and budget[0] > 0 else 0.0
+        if choice < 0.4:
+            lines.append(f"{pad}total += a * {rng.randint(1, 9)} - b")
+        elif choice < 0.65:
+            lines.append(f"{pad}if a > {rng.randint(0, 50)} and b != {rng.randint(0, 9)}:")
+            _generate_block(rng, depth - 1, budget, indent + 1, lines)
+            if rng.random() < 0.5:
+                lines.append(f"{pad}else:")
+                _generate_block(rng, depth - 1, budget, indent + 1, lines)
+        elif choice < 0.85:
+            lines.append(f"{pad}for item in items:")
+            _generate_block(rng, depth - 1, budget, indent + 1, lines)
+        else:
+            lines.append(f"{pad}while b > {rng.randint(0, 5)}:")
+            lines.append(f"{pad}    b -= 1")
+            _generate_block(rng, depth - 1, budget, indent + 1, lines)
+
+
+def generate_source(functions=10, depth=3, statements=20, seed=0):
+    """
+    Generates seeded Python source for the CFG benchmarks.
+
+    Args:
+        functions (int): Number of top-level functions.
+        depth (int): Maximum nesting depth of if / for / while blocks.
+        statements (int): Number of statements per function (not counting the return).
+        seed (int): Random seed.
+
+    Returns:
+        str: Valid Python source.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for index in range(functions):
+        lines.append(f"def generated_{index}(a, b, items):")
+        lines.append("    total = 0")
+        budget = [statements]
+        while budget[0] > 0:
+            _generate_block(rng, depth, budget, 1, lines)
+        lines.append("    return total")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def write_jsonl(users, path):
+    """Writes users as JSONL, e.g. to feed user_stream.py or user_parallel.py."""
+    with open(path, 'w') as f:
+        for user in users:
+            f.write(json.dumps(user) + "\n")
+
+
+# --- Benchmark cases ---
+# Each case takes the workload dict and returns (run, items): a no-argument callable that does
+# one full pass, and the number of items (users or functions) that pass handles.
+# Cases whose optional dependencies are missing raise ImportError and are reported as skipped;
+# cases that cannot produce their output raise RuntimeError and are reported as failed, which
+# fails the run.
+
+def _case_analyze_user_behavior(workload):
+    from user_analysis import analyze_user_behavior
+    users = workload['users']
+    return (lambda: analyze_user_behavior(users)), len(users)
+
+
+def _case_compiled_rules(workload):
+    from user_rules import analyze_user_behavior_compiled
+    users = workload['users']
+    return (lambda: analyze_user_behavior_compiled(users)), len(users)
+
+
+def _case_user_store(workload):
+    from user_records import analyze_store, load_users
+    store = load_users(workload['users'])
+    return (lambda: analyze_store(store)), len(store)
+
+
+def _case_numpy_batch(workload):
+    from user_batch import analyze_user_behavior_batch, columns_from_users
+    columns = columns_from_users(workload['users'])
+    return (lambda: analyze_user_behavior_batch(columns)), len(workload['users'])
+
+
+def _case_cfg_visitor(workload):
+    import graphviz
+    from generate_ast_cfg import CFGVisitor
+    source = workload['source']
+    code_lines = source.splitlines()
+
+    def run():
+        for node in ast.parse(source).body:
+            visitor = CFGVisitor(graphviz.Digraph(), code_lines)
+            visitor.visit_FunctionDef(node)
+
+    return run, workload['functions']
+
+
+def _case_cfg_builder(workload):
+    from cfg_builder import build_function_cfg
+    source = workload['source']
+    code_lines = source.splitlines()
+
+    def run():
+        for node in ast.parse(source).body:
+            build_function_cfg(node, code_lines).to_dot()
+
+    return run, workload['functions']
+
+
+def _case_generate_cfg_dot(workload):
+    import contextlib
+    import io
+    import os
+    import tempfile
+
+    import pycfg.pycfg  # noqa: F401  (generate_cfg_dot only reports a missing pycfg by printing it)
+    from generate_cfg import generate_cfg_dot
+    source = workload['source']
+    out_prefix = os.path.join(tempfile.mkdtemp(prefix='cfg_bench_'), 'generated_cfg')
+    printed = io.StringIO()
+
+    def run():
+        with contextlib.redirect_stdout(printed):  # One progress line per pass
+            return generate_cfg_dot(source, 'generated', out_prefix)
+
+    # generate_cfg_dot prints its errors instead of raising them, so check that a pass writes
+    # the graph before timing it; a failing pass would otherwise look very fast
+    if run() is None:
+        message = printed.getvalue().strip()
+        raise RuntimeError(message.splitlines()[0] if message else "no output written")
+    return run, workload['functions']
+
+
+CASES = {
+    'analyze_user_behavior': _case_analyze_user_behavior,
+    'compiled_rules': _case_compiled_rules,
+    'user_store': _case_user_store,
+    'numpy_batch': _case_numpy_batch,
+    'cfg_visitor': _case_cfg_visitor,
+    'cfg_builder': _case_cfg_builder,
+    'generate_cfg_dot': _case_generate_cfg_dot,
+}
+
+
+def _percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(run, items, repeat=5, warmup=1):
+    """
+    Times a benchmark case.
+
+    Args:
+        run (callable): One full pass over the workload.
+        items (int): Number of items a pass handles, for the throughput figure.
+        repeat (int): Number of timed passes.
+        warmup (int): Untimed passes before the timed ones.
+
+    Returns:
+        dict: Latency percentiles (seconds per pass), throughput (items per second at the
+        median latency) and the peak traced memory of one extra pass in bytes.
+    """
+    for _ in range(warmup):
+        run()
+    latencies = []
+    gc.collect()
+    gc.disable()  # Collector pauses over the workload would dominate the variance
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            latencies.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+
+    # Memory is measured on a separate pass, tracemalloc slows the code down too much to time it
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    median = statistics.median(latencies)
+    return {
+        'items': items,
+        'repeat': repeat,
+        'latency_p50': median,
+        'latency_p90': _percentile(latencies, 0.90),
+        'latency_p99': _percentile(latencies, 0.99),
+        'latency_min': latencies[0],
+        'throughput': items / median if median else float('inf'),
+        'peak_memory_bytes': peak,
+    }
+
+
+def run_benchmarks(names=None, users=100000, suspicious_ratio=0.1, actions_per_user=3, functions=50,
+                   depth=4, statements=40, repeat=5, seed=0):
+    """
+    Builds the synthetic workloads and runs the selected benchmark cases.
+
+    Returns:
+        dict: {'meta': run parameters and environment, 'results': case name -> measure() output,
+        'skipped': case name -> reason (missing dependency), 'failed': case name -> error}.
+    """
+    workload = {
+        'users': generate_users(users, suspicious_ratio, actions_per_user, seed),
+        'source': generate_source(functions, depth, statements, seed),
+        'functions': functions,
+    }
+    report = {
+        'meta': {
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'users': users, 'suspicious_ratio': suspicious_ratio, 'actions_per_user': actions_per_user,
+            'functions': functions, 'depth': depth, 'statements': statements,
+            'repeat': repeat, 'seed': seed,
+        },
+        'results': {},
+        'skipped': {},
+        'failed': {},
+    }
+    for name in names or CASES:
+        try:
+            run, items = CASES[name](workload)
+        except ImportError as e:
+            report['skipped'][name] = f"missing dependency: {e.name or e}"
+            continue
+        except RuntimeError as e:
+            report['failed'][name] = str(e)
+            continue
+        report['results'][name] = measure(run, items, repeat)
+    return report
+
+
+def compare_to_baseline(report, baseline, tolerance=0.10):
+    """
+    Compares a benchmark report with a stored one.
+
+    A case regresses when its median latency is more than `tolerance` (a fraction) above the
+    baseline's or its peak memory grew by more than the same fraction (plus MEMORY_SLACK_BYTES).
+    A case that failed or was skipped here but has a result in the baseline is a regression too
+    (cases that were not selected for this run are not compared).
+
+    Returns:
+        list: Human-readable regression messages, empty if none.
+    """
+    regressions = []
+    for name in baseline.get('results', {}):
+        if name in report['failed']:
+            regressions.append(f"{name}: failed ({report['failed'][name]}), the baseline has a result")
+        elif name in report['skipped']:
+            regressions.append(f"{name}: skipped ({report['skipped'][name]}), the baseline has a result")
+    for name, result in report['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if old is None:
+            continue
+        if result['latency_p50'] > old['latency_p50'] * (1 + tolerance):
+            regressions.append(f"{name}: median latency {result['latency_p50'] * 1000:.2f}ms vs "
+                               f"baseline {old['latency_p50'] * 1000:.2f}ms")
+        if result['peak_memory_bytes'] > old['peak_memory_bytes'] * (1 + tolerance) + MEMORY_SLACK_BYTES:
+            regressions.append(f"{name}: peak memory {result['peak_memory_bytes']} bytes vs "
+                               f"baseline {old['peak_memory_bytes']} bytes")
+    return regressions
+
+
+def format_report(report):
+    lines = ["--- Benchmarks ---",
+             f"{'case':<24}{'items/s':>14}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'peak MiB':>10}"]
+    for name, result in report['results'].items():
+        lines.append(f"{name:<24}{result['throughput']:>14,.0f}{result['latency_p50'] * 1000:>10.2f}"
+                     f"{result['latency_p90'] * 1000:>10.2f}{result['latency_p99'] * 1000:>10.2f}"
+                     f"{result['peak_memory_bytes'] / 2**20:>10.1f}")
+    for name, reason in report['skipped'].items():
+        lines.append(f"{name:<24}skipped ({reason})")
+    for name, error in report['failed'].items():
+        lines.append(f"{name:<24}FAILED ({error})")
+    return "\n".join(lines)
+
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the user analysis and CFG generation code.")
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), help="cases to run (default: all)")
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--suspicious-ratio', type=float, default=0.1)
+    parser.add_argument('--actions', type=int, default=3, help="recent_actions per user")
+    parser.add_argument('--functions', type=int, default=50, help="functions in the generated source")
+    parser.add_argument('--depth', type=int, default=4, help="nesting depth of the generated source")
+    parser.add_argument('--statements', type=int, default=40, help="statements per generated function")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="fail if slower than the results stored in this JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="allowed slowdown vs the baseline")
+    parser.add_argument('--write-users', metavar='JSONL', help="only write the generated users to a file")
+    args = parser.parse_args()
+
+    if args.write_users:
+        write_jsonl(generate_users(args.users, args.suspicious_ratio, args.actions, args.seed), args.write_users)
+        print(f"Wrote {args.users} users to {args.write_users}")
+        sys.exit(0)
+
+    bench_report = run_benchmarks(args.cases, args.users, args.suspicious_ratio, args.actions, args.functions,
+                                  args.depth, args.statements, args.repeat, args.seed)
+    print(format_report(bench_report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(bench_report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = compare_to_baseline(bench_report, json.load(f), args.tolerance)
+        if found:
+            print("\n--- REGRESSIONS ---", file=sys.stderr)
+            for message in found:
+                print(message, file=sys.stderr)
+            sys.exit(1)
+        print("No regressions against the baseline.")
+    if bench_report['failed']:
+        print(f"\n--- {len(bench_report['failed'])} case(s) failed ---", file=sys.stderr)
+        sys.exit(1)
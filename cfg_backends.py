@@ -0,0 +1,361 @@
+import argparse
+import ast
+import os
+import re
+import time
+import tracemalloc
+from collections import Counter
+
+from cfg_builder import BLOCK, BRANCH, ENTRY, EXIT, JOIN, CFGGraph, build_function_cfg, iter_function_nodes
+from generate_ast_cfg import CFGVisitor, iter_python_files
+
+SHAPE_KINDS = {'ellipse': ENTRY, 'doublecircle': EXIT, 'diamond': BRANCH, 'point': JOIN}
+LINE_PREFIX = re.compile(r'L(\d+): ')
+DEFAULT_BACKENDS = ('stack', 'visitor-bb', 'visitor', 'pycfg')
+# Edge labels are compared by their lower-cased first word ("False (No else)" -> "false"), plus these
+EDGE_LABEL_ALIASES = {'enter': 'true'}
+
+
+class _DigraphRecorder:
+    """
+    Stands in for the graphviz.Digraph that CFGVisitor draws on and records into a CFGGraph.
+
+    Node kinds come from the shape (ellipse, doublecircle, point; everything else is a BLOCK) and
+    source lines from the "L12: " prefixes of the labels, so a basic block spanning several
+    statements keeps its first and last line.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.ids = {}
+        self.names = []
+
+    def node(self, name, label, shape='box', **attributes):
+        kind = SHAPE_KINDS.get(shape, BLOCK)
+        lines = [int(match.group(1)) for match in map(LINE_PREFIX.match, label.split('\n')) if match]
+        if lines and kind == BLOCK:
+            self.ids[name] = self.graph.add_node(kind, LINE_PREFIX.sub('', label, count=1), lines[0], lines[-1])
+        else:
+            self.ids[name] = self.graph.add_node(kind, label)
+        self.names.append(name)
+
+    def edge(self, tail, head, label=''):
+        self.graph.add_edge(self.ids[tail], self.ids[head], label)
+
+
+def visitor_cfg(func_node, code_lines, basic_blocks=True):
+    """
+    Runs CFGVisitor on a function and records its graph.
+
+    Returns:
+        tuple: (CFGGraph, names) where names[i] is CFGVisitor's own id ("node_7") of graph node i.
+    """
+    recorder = _DigraphRecorder(CFGGraph(func_node.name))
+    CFGVisitor(recorder, code_lines, basic_blocks).visit_FunctionDef(func_node)
+    return recorder.graph, recorder.names
+
+
+def build_visitor_cfg(func_node, code_lines):
+    """Classic CFGVisitor graph: one node per statement and expression, first statement of nested bodies only."""
+    return visitor_cfg(func_node, code_lines, False)[0]
+
+
+def build_visitor_bb_cfg(func_node, code_lines):
+    """CFGVisitor in basic-block mode (recursive, with Graphviz-style string node ids)."""
+    return visitor_cfg(func_node, code_lines, True)[0]
+
+
+def build_pycfg_cfg(func_node, code_lines):
+    """
+    pycfg's PyCFG graph of one function.
+
+    The function is walked as a one-statement module, so pycfg sees the already parsed tree and
+    its absolute line numbers. Call edges to other functions (PyCFG.link_functions) are left out,
+    like in the other backends. pycfg keeps its nodes in class-level registries, which are reset
+    for every function; it is therefore not thread-safe.
+
+    Raises:
+        ImportError: pycfg or one of its dependencies (astunparse, pygraphviz) is missing.
+        ValueError: pycfg does not handle this function (e.g. async def).
+    """
+    from pycfg.pycfg import CFGNode, PyCFG
+
+    if not isinstance(func_node, ast.FunctionDef):
+        raise ValueError("pycfg only handles plain 'def' functions")
+    CFGNode.registry = 0
+    CFGNode.cache = {}
+    CFGNode.stack = []
+    cfg = PyCFG()
+    cfg.walk(ast.Module(body=[func_node], type_ignores=[]), [cfg.founder])
+    nodes = CFGNode.cache
+    CFGNode.cache = {}
+    enter, _ = cfg.functions[func_node.name]
+
+    children = {}
+    for node in nodes.values():
+        for parent in node.parents:
+            children.setdefault(parent.rid, []).append(node)
+    # Only what the function's entry reaches: nested functions get their own entry nodes
+    graph = CFGGraph(func_node.name)
+    ids = {}
+    order = [enter]
+    stack = [enter]
+    ids[enter.rid] = None
+    while stack:
+        for child in children.get(stack.pop().rid, ()):
+            if child.rid not in ids:
+                ids[child.rid] = None
+                order.append(child)
+                stack.append(child)
+    for node in sorted(order, key=lambda node: node.rid):
+        text = node.source().split('\n', 1)[0]
+        if getattr(node, 'calleelink', False):
+            ids[node.rid] = graph.add_node(ENTRY, text)
+        elif getattr(node, 'fn_exit_node', False):
+            ids[node.rid] = graph.add_node(EXIT, text)
+        else:
+            kind = BRANCH if len(children.get(node.rid, ())) > 1 else BLOCK
+            ids[node.rid] = graph.add_node(kind, text, node.lineno())
+    for node in sorted(order, key=lambda node: node.rid):
+        for parent in node.parents:
+            if parent.rid in ids:
+                graph.add_edge(ids[parent.rid], ids[node.rid])
+    return graph
+
+
+BACKENDS = {
+    'stack': build_function_cfg,
+    'visitor-bb': build_visitor_bb_cfg,
+    'visitor': build_visitor_cfg,
+    'pycfg': build_pycfg_cfg,
+}
+
+
+def backend_error(name):
+    """Returns why the named backend cannot run here (e.g. a missing dependency), or None."""
+    if name not in BACKENDS:
+        return f"unknown backend (choose from {', '.join(BACKENDS)})"
+    if name == 'pycfg':
+        try:
+            import pycfg.pycfg  # noqa: F401
+        except ImportError as e:
+            return f"pycfg cannot be imported: {e}"
+    return None
+
+
+def graph_shape(graph):
+    """
+    Backend-neutral summary of a graph's structure, for comparing backends.
+
+    Node ids, texts and kinds differ between backends; what is compared is the size, the
+    cyclomatic complexity, how many nodes branch (more than one successor) or join (more than
+    one predecessor) and the multiset of edge labels.
+    """
+    out_degree = Counter(graph.edge_src)
+    in_degree = Counter(graph.edge_dst)
+    values = [EDGE_LABEL_ALIASES.get(word, word) for word in
+              (value.split(' ', 1)[0].lower() for value in graph.edge_label_values)]
+    return {
+        'nodes': graph.node_count,
+        'edges': graph.edge_count,
+        'complexity': graph.complexity(),
+        'branches': sum(1 for count in out_degree.values() if count > 1),
+        'joins': sum(1 for count in in_degree.values() if count > 1),
+        'edge_labels': Counter(values[code] for code in graph.edge_labels if code),
+    }
+
+
+def load_functions(path):
+    """
+    Parses a file, or every Python file under a directory, once.
+
+    Returns:
+        tuple: ([(name, function node, code lines)], [(file, error)]) with names like
+        "pkg/mod.py:Class.method".
+    """
+    paths = [path] if os.path.isfile(path) else iter_python_files(path)
+    root = os.path.dirname(path) if os.path.isfile(path) else path
+    functions, errors = [], []
+    for file_path in paths:
+        relative = os.path.relpath(file_path, root)
+        try:
+            with open(file_path, 'rb') as f:
+                source = f.read().decode('utf-8')
+            tree = ast.parse(source, filename=file_path)
+        except (OSError, UnicodeDecodeError, SyntaxError, ValueError) as e:
+            errors.append((relative, str(e)))
+            continue
+        code_lines = source.splitlines()
+        for qualname, func_node in iter_function_nodes(tree):
+            functions.append((f"{relative}:{qualname}", func_node, code_lines))
+    return functions, errors
+
+
+def run_backend(build, functions, trace_memory=False):
+    """
+    Builds every function's graph with one backend.
+
+    Returns:
+        dict: 'shapes' (name -> graph_shape), 'failures' (name -> error), 'seconds' (build time
+        only, summed over the functions) and, with `trace_memory`, 'peak_bytes': the highest
+        tracemalloc peak of a single build. Memory tracing slows the builds down, so the time of
+        a traced run is not representative.
+    """
+    shapes, failures = {}, {}
+    seconds = 0.0
+    peak_bytes = 0
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        for name, func_node, code_lines in functions:
+            if trace_memory:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            started = time.perf_counter()
+            try:
+                graph = build(func_node, code_lines)
+            except Exception as e:  # A backend that cannot handle a construct only fails that function
+                failures[name] = f"{type(e).__name__}: {e}"
+                continue
+            finally:
+                seconds += time.perf_counter() - started
+            if trace_memory:
+                peak_bytes = max(peak_bytes, tracemalloc.get_traced_memory()[1] - baseline)
+            shapes[name] = graph_shape(graph)
+            del graph
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return {'shapes': shapes, 'failures': failures, 'seconds': seconds, 'peak_bytes': peak_bytes}
+
+
+def shape_differences(reference, other):
+    """Names the fields of two graph_shape dicts that differ, e.g. ['complexity 5 != 4']."""
+    differences = []
+    for field in ('complexity', 'branches', 'joins', 'nodes', 'edges'):
+        if reference[field] != other[field]:
+            differences.append(f"{field} {other[field]} != {reference[field]}")
+    if reference['edge_labels'] != other['edge_labels']:
+        missing = reference['edge_labels'] - other['edge_labels']
+        extra = other['edge_labels'] - reference['edge_labels']
+        differences.append(f"edge labels -{dict(missing)} +{dict(extra)}")
+    return differences
+
+
+def compare_backends(functions, backends, repeat=1):
+    """
+    Runs every backend on the same parsed functions; the first backend is the reference.
+
+    Each backend is timed `repeat` times (best run kept) and then run once more under
+    tracemalloc for its peak memory.
+
+    Returns:
+        list: One dict per backend with 'backend', 'seconds', 'peak_bytes', 'built', 'failures',
+        'nodes', 'edges' and 'differences' (name -> shape_differences against the reference).
+    """
+    results = []
+    reference = None
+    for name in backends:
+        build = BACKENDS[name]
+        timed = min((run_backend(build, functions) for _ in range(max(repeat, 1))), key=lambda run: run['seconds'])
+        traced = run_backend(build, functions, trace_memory=True)
+        shapes = timed['shapes']
+        if reference is None:
+            reference = shapes
+        differences = {}
+        for function_name, shape in shapes.items():
+            if function_name in reference:
+                found = shape_differences(reference[function_name], shape)
+                if found:
+                    differences[function_name] = found
+        results.append({
+            'backend': name,
+            'seconds': timed['seconds'],
+            'peak_bytes': traced['peak_bytes'],
+            'built': len(shapes),
+            'failures': timed['failures'],
+            'nodes': sum(shape['nodes'] for shape in shapes.values()),
+            'edges': sum(shape['edges'] for shape in shapes.values()),
+            'differences': differences,
+        })
+    return results
+
+
+def print_comparison(results, total, show=5):
+    reference = results[0]['backend']
+    print(f"{'backend':<12} {'built':>7} {'failed':>7} {'seconds':>9} {'func/s':>9} {'peak KiB':>9} "
+          f"{'nodes':>9} {'edges':>9} {'differ':>7}")
+    for result in results:
+        rate = result['built'] / result['seconds'] if result['seconds'] else 0.0
+        print(f"{result['backend']:<12} {result['built']:>7} {len(result['failures']):>7} "
+              f"{result['seconds']:>9.3f} {rate:>9.0f} {result['peak_bytes'] / 1024:>9.1f} "
+              f"{result['nodes']:>9} {result['edges']:>9} {len(result['differences']):>7}")
+    print(f"--- {total} functions; 'differ' counts functions whose structure differs from '{reference}' ---")
+    for result in results:
+        complexity = sum(1 for found in result['differences'].values() if found[0].startswith('complexity'))
+        if result['differences']:
+            print(f"{result['backend']}: {len(result['differences'])} differ from '{reference}', "
+                  f"{complexity} of them in complexity")
+        for function_name, found in list(result['differences'].items())[:show]:
+            print(f"  {function_name}: {'; '.join(found)}")
+        for function_name, error in list(result['failures'].items())[:show]:
+            print(f"  {function_name}: failed: {error}")
+
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build CFGs with a choice of backend, or compare the backends.")
+    parser.add_argument('path', help="Python file or directory to analyze")
+    parser.add_argument('--backend', default='stack', choices=list(BACKENDS),
+                        help="CFG builder to use (default: stack, the iterative cfg_builder)")
+    parser.add_argument('--function', help="only this function (qualified name, e.g. MyClass.method)")
+    parser.add_argument('--output-dir', default='cfg_output', help="where the .gv files are written")
+    parser.add_argument('--compare', action='store_true',
+                        help="run several backends on the same sources and compare them instead of writing graphs")
+    parser.add_argument('--backends', default=','.join(DEFAULT_BACKENDS),
+                        help="comma-separated backends for --compare; the first is the reference")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per backend for --compare (best is kept)")
+    parser.add_argument('--show', type=int, default=5, help="differing functions listed per backend for --compare")
+    args = parser.parse_args()
+
+    functions, parse_errors = load_functions(args.path)
+    for relative, error in parse_errors:
+        print(f"Error: could not parse {relative}: {error}")
+    if args.function:
+        functions = [entry for entry in functions if entry[0].split(':', 1)[1] == args.function]
+        if not functions:
+            print(f"Error: function '{args.function}' not found in {args.path}.")
+
+    if args.compare:
+        backends = []
+        for name in args.backends.split(','):
+            error = backend_error(name)
+            if error:
+                print(f"Skipping backend '{name}': {error}")
+            else:
+                backends.append(name)
+        if backends and functions:
+            print_comparison(compare_backends(functions, backends, args.repeat), len(functions), args.show)
+    elif functions:
+        error = backend_error(args.backend)
+        if error:
+            print(f"Error: backend '{args.backend}' is unavailable: {error}")
+        else:
+            build = BACKENDS[args.backend]
+            os.makedirs(args.output_dir, exist_ok=True)
+            started = time.perf_counter()
+            built = 0
+            for name, func_node, code_lines in functions:
+                try:
+                    graph = build(func_node, code_lines)
+                except Exception as e:
+                    print(f"Error: {args.backend} could not build {name}: {e}")
+                    continue
+                built += 1
+                file_name = name.replace('<locals>', 'locals').replace(os.sep, '_').replace(':', '.')
+                output_path = os.path.join(args.output_dir, f"{file_name}_{args.backend}_cfg.gv")
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    f.write(graph.to_dot())
+                print(f"{name}: {graph.node_count} nodes, {graph.edge_count} edges, "
+                      f"complexity {graph.complexity()} -> {output_path}")
+            print(f"--- {args.backend}: built {built} CFGs in {time.perf_counter() - started:.3f}s ---")
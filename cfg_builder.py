@@ -0,0 +1,413 @@
+import argparse
+import ast
+import os
+import time
+from array import array
+
+# Node kinds
+ENTRY, EXIT, BLOCK, BRANCH, JOIN = 0, 1, 2, 3, 4
+KIND_ATTRIBUTES = {
+    ENTRY: 'shape=ellipse color=green',
+    EXIT: 'shape=doublecircle color=red',
+    BLOCK: 'shape=box style=rounded',
+    BRANCH: 'shape=diamond',
+    JOIN: 'shape=point',
+}
+SNIPPET_LENGTH = 60
+# Branch ends are merged into a JOIN node beyond this many, so long elif chains stay linear
+MAX_PENDING = 8
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+BLOCK_NODES = (ast.stmt, ast.excepthandler, ast.match_case)
+
+# Work stack operations (see _Builder.run)
+_STMT, _BRANCH, _COLLECT, _RESUME, _LINK, _LOOP_EXIT, _LEAVE = range(7)
+
+
+def dot_quote(text):
+    """Quotes text as a DOT string, escaping backslashes, quotes and newlines."""
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+
+class CFGGraph:
+    """
+    Control flow graph kept in flat, integer-indexed arrays.
+
+    Node i has kind kinds[i], source lines lines[i] to end_lines[i] (0 for ENTRY / EXIT) and the
+    text texts[i]. Edge j goes from edge_src[j] to edge_dst[j], labelled
+    edge_label_values[edge_labels[j]]. DOT text is only produced by to_dot.
+
+    Every compound statement (if, loop, try, with, match) also opens a region holding its header
+    and its bodies: node i lies in region node_regions[i] (-1 for the function level), and region
+    r is nested in region_parents[r] (always a smaller id, or -1). cfg_render draws regions as
+    clusters and collapses deep ones.
+    """
+
+    __slots__ = ('name', 'kinds', 'lines', 'end_lines', 'texts', 'edge_src', 'edge_dst', 'edge_labels',
+                 'edge_label_values', '_edge_label_codes', 'node_regions', 'region_parents', 'region_lines',
+                 'region_texts')
+
+    def __init__(self, name=''):
+        self.name = name
+        self.kinds = array('b')
+        self.lines = array('i')
+        self.end_lines = array('i')
+        self.texts = []
+        self.edge_src = array('i')
+        self.edge_dst = array('i')
+        self.edge_labels = array('i')
+        self.edge_label_values = ['']
+        self._edge_label_codes = {'': 0}
+        self.node_regions = array('i')
+        self.region_parents = array('i')
+        self.region_lines = array('i')
+        self.region_texts = []
+
+    @property
+    def node_count(self):
+        return len(self.texts)
+
+    @property
+    def edge_count(self):
+        return len(self.edge_src)
+
+    @property
+    def region_count(self):
+        return len(self.region_texts)
+
+    def add_node(self, kind, text, line=0, end_line=None, region=-1):
+        """Adds a node and returns its id."""
+        self.node_regions.append(region)
+        self.kinds.append(kind)
+        self.lines.append(line)
+        self.end_lines.append(line if end_line is None else end_line)
+        self.texts.append(text)
+        return len(self.texts) - 1
+
+    def add_region(self, parent, line, text):
+        """Adds a region nested in `parent` (-1 for the function level) and returns its id."""
+        self.region_parents.append(parent)
+        self.region_lines.append(line)
+        self.region_texts.append(text)
+        return len(self.region_texts) - 1
+
+    def add_edge(self, source, target, label=''):
+        code = self._edge_label_codes.get(label)
+        if code is None:
+            code = self._edge_label_codes[label] = len(self.edge_label_values)
+            self.edge_label_values.append(label)
+        self.edge_src.append(source)
+        self.edge_dst.append(target)
+        self.edge_labels.append(code)
+
+    def label(self, node):
+        """Display label of a node, e.g. "L12-15: total = 0" for a block starting at line 12."""
+        line, end_line = self.lines[node], self.end_lines[node]
+        if not line:
+            return self.texts[node]
+        span = f"L{line}" if end_line == line else f"L{line}-{end_line}"
+        return f"{span}: {self.texts[node]}"
+
+    def complexity(self):
+        """Cyclomatic complexity E - N + 2P, with P (connected components) found by union-find."""
+        parent = list(range(self.node_count))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        components = self.node_count
+        for source, target in zip(self.edge_src, self.edge_dst):
+            a, b = find(source), find(target)
+            if a != b:
+                parent[a] = b
+                components -= 1
+        return self.edge_count - self.node_count + 2 * components
+
+    def to_dot(self, graph_attributes='rankdir=LR'):
+        """Returns the graph as DOT source."""
+        out = [f"digraph {dot_quote(self.name)} {{", f"\tgraph [{graph_attributes}]"]
+        for node, kind in enumerate(self.kinds):
+            out.append(f"\t{node} [label={dot_quote(self.label(node))} {KIND_ATTRIBUTES[kind]}]")
+        values = self.edge_label_values
+        for source, target, label in zip(self.edge_src, self.edge_dst, self.edge_labels):
+            if label:
+                out.append(f"\t{source} -> {target} [label={dot_quote(values[label])}]")
+            else:
+                out.append(f"\t{source} -> {target}")
+        out.append("}")
+        return "\n".join(out) + "\n"
+
+
+class _Builder:
+    """
+    Builds a CFGGraph from a function body without recursion.
+
+    Statements are taken off an explicit work stack and dispatched on their type through a table
+    built once per builder; anything not in the table is straight-line code that extends the open
+    block. Compound statements push their bodies back onto the stack, framed by small operations:
+
+        _BRANCH (node, label)  the next statements hang off `node` through an edge with `label`
+        _COLLECT (exits)       park the dangling ends of a branch in the `exits` list
+        _RESUME (exits)        continue from all parked ends (the join of an if / try / match)
+        _LINK (node, label)    connect the dangling ends to `node` (a loop's back edge)
+        _LOOP_EXIT ()          leave the innermost loop (for break / continue)
+        _LEAVE (region)        the compound statement is done, go back to the enclosing region
+
+    The control flow between nodes is tracked as `pending`: the (node, edge label) pairs the next
+    node gets an edge from; an empty `pending` means unreachable code. Join nodes are only added
+    when more than MAX_PENDING ends meet (they do not change the cyclomatic complexity).
+    """
+
+    def __init__(self, graph, code_lines):
+        self.graph = graph
+        self.code_lines = code_lines
+        self.pending = []
+        self.block = -1
+        self.exit = -1
+        self.loops = []
+        self.region = -1
+        self.handlers = {
+            ast.If: self._if,
+            ast.For: self._loop,
+            ast.AsyncFor: self._loop,
+            ast.While: self._loop,
+            ast.Try: self._try,
+            ast.With: self._with,
+            ast.AsyncWith: self._with,
+            ast.Return: self._return,
+            ast.Raise: self._return,
+            ast.Break: self._break,
+            ast.Continue: self._continue,
+        }
+        if hasattr(ast, 'TryStar'):
+            self.handlers[ast.TryStar] = self._try
+        if hasattr(ast, 'Match'):
+            self.handlers[ast.Match] = self._match
+
+    def snippet(self, line):
+        """The first source line of a statement, stripped and truncated."""
+        text = self.code_lines[line - 1].strip() if 0 < line <= len(self.code_lines) else ''
+        return text if len(text) <= SNIPPET_LENGTH else text[:SNIPPET_LENGTH - 3] + "..."
+
+    def connect(self, node):
+        add_edge = self.graph.add_edge
+        for source, label in self.pending:
+            add_edge(source, node, label)
+
+    def _simple(self, stmt):
+        graph = self.graph
+        end_line = getattr(stmt, 'end_lineno', None) or stmt.lineno
+        if len(self.pending) == 1 and self.pending[0][0] == self.block >= 0:
+            graph.end_lines[self.block] = end_line
+            return
+        self.block = graph.add_node(BLOCK, self.snippet(stmt.lineno), stmt.lineno, end_line, self.region)
+        self.connect(self.block)
+        self.pending = [(self.block, '')]
+
+    def _header(self, stmt):
+        """Adds the node of a compound statement, which opens a region (closed by run)."""
+        text = self.snippet(stmt.lineno)
+        self.region = self.graph.add_region(self.region, stmt.lineno, text)
+        node = self.graph.add_node(BRANCH, text, stmt.lineno, region=self.region)
+        self.connect(node)
+        self.pending = [(node, '')]
+        self.block = -1
+        return node
+
+    def _if(self, stmt, tasks):
+        header = self._header(stmt)
+        exits = []
+        tasks.append((_BRANCH, header, 'True'))
+        tasks.extend((_STMT, child) for child in stmt.body)
+        tasks.append((_COLLECT, exits))
+        tasks.append((_BRANCH, header, 'False'))
+        tasks.extend((_STMT, child) for child in stmt.orelse)
+        tasks.append((_COLLECT, exits))
+        tasks.append((_RESUME, exits))
+
+    def _loop(self, stmt, tasks):
+        header = self._header(stmt)
+        exits = []
+        self.loops.append((header, exits))  # The body's tasks run before anything else on the stack
+        tasks.append((_BRANCH, header, 'True'))
+        tasks.extend((_STMT, child) for child in stmt.body)
+        tasks.append((_LINK, header, 'Loop back'))
+        tasks.append((_LOOP_EXIT,))
+        tasks.append((_BRANCH, header, 'False'))
+        tasks.extend((_STMT, child) for child in stmt.orelse)
+        tasks.append((_COLLECT, exits))
+        tasks.append((_RESUME, exits))
+
+    def _try(self, stmt, tasks):
+        header = self._header(stmt)
+        exits = []
+        tasks.extend((_STMT, child) for child in stmt.body)
+        tasks.extend((_STMT, child) for child in stmt.orelse)
+        tasks.append((_COLLECT, exits))
+        for handler in stmt.handlers:
+            tasks.append((_BRANCH, header, self.snippet(handler.lineno).rstrip(':')))
+            tasks.extend((_STMT, child) for child in handler.body)
+            tasks.append((_COLLECT, exits))
+        tasks.append((_RESUME, exits))
+        tasks.extend((_STMT, child) for child in stmt.finalbody)
+
+    def _with(self, stmt, tasks):
+        self._header(stmt)
+        tasks.extend((_STMT, child) for child in stmt.body)
+
+    def _match(self, stmt, tasks):
+        header = self._header(stmt)
+        exits = []
+        irrefutable = False
+        for case in stmt.cases:
+            irrefutable |= (case.guard is None and isinstance(case.pattern, ast.MatchAs)
+                            and case.pattern.pattern is None)
+            tasks.append((_BRANCH, header, self.snippet(case.pattern.lineno).rstrip(':')))
+            tasks.extend((_STMT, child) for child in case.body)
+            tasks.append((_COLLECT, exits))
+        if not irrefutable:
+            tasks.append((_BRANCH, header, 'no match'))
+            tasks.append((_COLLECT, exits))
+        tasks.append((_RESUME, exits))
+
+    def _jump(self, target, label):
+        add_edge = self.graph.add_edge
+        for source, _ in self.pending:
+            add_edge(source, target, label)
+        self.pending = []
+
+    def _return(self, stmt, tasks):
+        self._simple(stmt)
+        self._jump(self.exit, 'return' if isinstance(stmt, ast.Return) else 'raise')
+
+    def _break(self, stmt, tasks):
+        self._simple(stmt)
+        if self.loops:
+            self.loops[-1][1].extend((source, 'break') for source, _ in self.pending)
+            self.pending = []
+
+    def _continue(self, stmt, tasks):
+        self._simple(stmt)
+        if self.loops:
+            self._jump(self.loops[-1][0], 'continue')
+
+    def run(self, func_node):
+        graph = self.graph
+        entry = graph.add_node(ENTRY, f"ENTRY: {func_node.name}")
+        self.exit = graph.add_node(EXIT, f"EXIT: {func_node.name}")
+        self.pending = [(entry, '')]
+
+        handlers = self.handlers
+        stack = [(_STMT, stmt) for stmt in reversed(func_node.body)]
+        while stack:
+            task = stack.pop()
+            op = task[0]
+            if op == _STMT:
+                stmt = task[1]
+                handler = handlers.get(type(stmt))
+                if handler is None:
+                    self._simple(stmt)
+                else:
+                    tasks = []
+                    region = self.region
+                    handler(stmt, tasks)
+                    if self.region != region:
+                        tasks.append((_LEAVE, region))
+                    stack.extend(reversed(tasks))
+            elif op == _BRANCH:
+                self.pending = [(task[1], task[2])]
+                self.block = -1
+            elif op == _COLLECT:
+                task[1].extend(self.pending)
+                self.pending = []
+            elif op == _RESUME:
+                self.pending = task[1]
+                self.block = -1
+                if len(self.pending) > MAX_PENDING:
+                    join = graph.add_node(JOIN, '', region=self.region)
+                    self.connect(join)
+                    self.pending = [(join, '')]
+            elif op == _LINK:
+                add_edge = graph.add_edge
+                for source, label in self.pending:
+                    add_edge(source, task[1], label or task[2])
+                self.pending = []
+            elif op == _LOOP_EXIT:
+                self.loops.pop()
+            else:  # _LEAVE
+                self.region = task[1]
+                self.block = -1  # The next statement starts a new block outside the region
+        self.connect(self.exit)
+        return graph
+
+
+def build_function_cfg(func_node, code_lines):
+    """
+    Builds the basic-block CFG of one function iteratively, in time and memory linear in its size.
+
+    Straight-line statements are merged into blocks; if / for / while / try / with / match
+    headers get their own nodes, and return, raise, break and continue jump where they lead.
+    Expressions are never visited, and node labels only use the first line of each statement.
+
+    Args:
+        func_node (ast.FunctionDef | ast.AsyncFunctionDef): The function.
+        code_lines (list): Lines of the source the function was parsed from.
+
+    Returns:
+        CFGGraph: The graph.
+    """
+    return _Builder(CFGGraph(func_node.name), code_lines).run(func_node)
+
+
+def iter_function_nodes(tree):
+    """
+    Yields (qualified name, function node) for every function and method, without recursion.
+
+    Same names and order as generate_ast_cfg.iter_functions.
+    """
+    stack = [(tree, '', None)]
+    while stack:
+        node, prefix, qualname = stack.pop()
+        if qualname is not None:
+            yield qualname, node
+        children = [child for child in ast.iter_child_nodes(node) if isinstance(child, BLOCK_NODES)]
+        for child in reversed(children):
+            if isinstance(child, FUNCTION_NODES):
+                stack.append((child, f"{prefix}{child.name}.<locals>.", f"{prefix}{child.name}"))
+            elif isinstance(child, ast.ClassDef):
+                stack.append((child, f"{prefix}{child.name}.", None))
+            else:  # Functions defined inside if / try / with blocks
+                stack.append((child, prefix, None))
+
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build basic-block CFGs without recursion and write them as DOT.")
+    parser.add_argument('path', help="Python file to analyze")
+    parser.add_argument('--function', help="only this function (qualified name, e.g. MyClass.method)")
+    parser.add_argument('--output-dir', default='cfg_output', help="where the .gv files are written")
+    args = parser.parse_args()
+
+    with open(args.path, 'rb') as f:
+        source = f.read().decode('utf-8')
+    started = time.perf_counter()
+    tree = ast.parse(source, filename=args.path)
+    code_lines = source.splitlines()
+    os.makedirs(args.output_dir, exist_ok=True)
+    built = 0
+    for qualname, func_node in iter_function_nodes(tree):
+        if args.function and qualname != args.function:
+            continue
+        graph = build_function_cfg(func_node, code_lines)
+        output_path = os.path.join(args.output_dir, f"{qualname.replace('<locals>', 'locals')}_cfg.gv")
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(graph.to_dot())
+        built += 1
+        print(f"{qualname}: {graph.node_count} nodes, {graph.edge_count} edges, "
+              f"complexity {graph.complexity()} -> {output_path}")
+    if args.function and not built:
+        print(f"Error: function '{args.function}' not found in {args.path}.")
+    else:
+        print(f"--- Built {built} CFGs in {time.perf_counter() - started:.3f}s ---")
@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+CACHE_FORMAT = 2
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def tool_version():
+    """
+    Identifies the code that produced a cache entry.
+
+    Combines the radon and graphviz versions with a hash of the CFG generator's own source,
+    so editing generate_ast_cfg.py invalidates the cache without a manual version bump.
+    """
+    import graphviz
+    import radon
+
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ('generate_ast_cfg.py', 'cfg_cache.py'):
+        with open(os.path.join(here, name), 'rb') as f:
+            digest.update(f.read())
+    return f"{CACHE_FORMAT}/radon-{radon.__version__}/graphviz-{graphviz.__version__}/{digest.hexdigest()[:16]}"
+
+
+def _write_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class CFGCache:
+    """
+    Content-addressed on-disk cache for per-function CFG and complexity results.
+
+    Layout under `directory`:
+        objects/<key>/   meta.json (complexity, DOT source, artifact names, sizes and digests) plus the rendered files,
+                         keyed by a hash of the function's source, its position and the tool version
+        files/<key>.json manifest of a whole source file, keyed by a hash of its bytes, so an
+                         unchanged file is restored without being parsed at all
+        lru.json         size and last use of every entry, for the size limit
+
+    Several processes may read and add entries at the same time (writes are atomic renames of
+    content-addressed paths), but only one process should call `finish`, which updates the LRU
+    bookkeeping and evicts old entries. Within a process, the counters and the set of touched
+    entries are guarded by a lock, so a thread pool may share one instance.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, version=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version or tool_version()
+        self.objects_dir = os.path.join(directory, 'objects')
+        self.files_dir = os.path.join(directory, 'files')
+        self.stats = {'file_hits': 0, 'file_misses': 0, 'hits': 0, 'misses': 0, 'evicted': 0}
+        self.touched = set()
+        self._lock = threading.Lock()
+
+    def _key(self, *parts):
+        digest = hashlib.sha256(self.version.encode())
+        for part in parts:
+            digest.update(b'\0')
+            digest.update(part if isinstance(part, bytes) else str(part).encode())
+        return digest.hexdigest()
+
+    def file_key(self, data, options):
+        """Key of a whole source file (its bytes) for the given output formats and build options."""
+        return self._key('file', data, ','.join(options))
+
+    def function_key(self, qualname, lineno, source, options):
+        """
+        Key of one function's results.
+
+        The line number is part of the key because the CFG labels carry absolute line numbers;
+        `options` lists the output formats plus any build option such as 'basic-blocks'.
+        """
+        return self._key('function', qualname, lineno, source, ','.join(options))
+
+    def load(self, key):
+        """Returns the stored metadata of a function entry, or None (counted as a miss)."""
+        meta = _read_json(os.path.join(self.objects_dir, key, 'meta.json'))
+        with self._lock:
+            if meta is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            self.touched.add(f"objects/{key}")
+        return meta
+
+    def restore(self, key, artifacts, base):
+        """
+        Makes sure the cached artifacts of an entry exist at `base` + extension.
+
+        Files that are already there with the same content (size and SHA-256) are left alone,
+        so a no-change run does not rewrite the outputs; anything else is overwritten.
+
+        Args:
+            key (str): The function entry.
+            artifacts (list): (name, size, sha256) triples from the entry's metadata.
+            base (str): Output path without the extension.
+
+        Returns:
+            list: The output paths.
+        """
+        outputs = []
+        for name, size, digest in artifacts:
+            target = base + os.path.splitext(name)[1]
+            try:
+                up_to_date = os.path.getsize(target) == size and _file_digest(target) == digest
+            except OSError:
+                up_to_date = False
+            if not up_to_date:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(os.path.join(self.objects_dir, key, name), target)
+            outputs.append(target)
+        return outputs
+
+    def store(self, key, meta, outputs):
+        """
+        Stores a function entry: its metadata plus copies of the rendered output files.
+
+        Returns:
+            dict: The stored metadata, including the 'artifacts' list.
+        """
+        final_dir = os.path.join(self.objects_dir, key)
+        os.makedirs(self.objects_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.objects_dir, prefix='.tmp-')
+        artifacts = []
+        for path in outputs:
+            name = 'artifact' + os.path.splitext(path)[1]
+            shutil.copyfile(path, os.path.join(tmp_dir, name))
+            artifacts.append((name, os.path.getsize(path), _file_digest(path)))
+        meta = {**meta, 'artifacts': artifacts}
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmp_dir, final_dir)
+        except OSError:  # Another worker stored the same content first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        with self._lock:
+            self.touched.add(f"objects/{key}")
+        return meta
+
+    def load_manifest(self, file_key):
+        """Returns the manifest of a source file if it and every function entry it names exist."""
+        manifest = _read_json(os.path.join(self.files_dir, f"{file_key}.json"))
+        if manifest is None or not all(os.path.isdir(os.path.join(self.objects_dir, entry['key']))
+                                       for entry in manifest['functions']):
+            with self._lock:
+                self.stats['file_misses'] += 1
+            return None
+        with self._lock:
+            self.stats['file_hits'] += 1
+            self.touched.add(f"files/{file_key}.json")
+            self.touched.update(f"objects/{entry['key']}" for entry in manifest['functions'])
+        return manifest
+
+    def store_manifest(self, file_key, functions):
+        """
+        Stores the manifest of a source file.
+
+        Args:
+            file_key (str): See file_key.
+            functions (list): Dicts with the function's 'key', 'function', 'lineno', 'complexity'
+                and output 'base' name (relative to the file's output directory).
+        """
+        _write_json_atomic(os.path.join(self.files_dir, f"{file_key}.json"), {'functions': functions})
+        with self._lock:
+            self.touched.add(f"files/{file_key}.json")
+
+    def merge(self, stats, touched):
+        """Adds the counters and touched entries reported by a worker process."""
+        with self._lock:
+            for name, value in stats.items():
+                self.stats[name] += value
+            self.touched.update(touched)
+
+    def _entry_size(self, relative):
+        path = os.path.join(self.directory, relative)
+        if os.path.isdir(path):
+            return sum(entry.stat().st_size for entry in os.scandir(path))
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def finish(self):
+        """Records the use of every touched entry and evicts least recently used ones over the size limit."""
+        lru_path = os.path.join(self.directory, 'lru.json')
+        lru = _read_json(lru_path) or {}
+        now = time.time()
+        with self._lock:
+            touched, self.touched = self.touched, set()
+        for relative in touched:
+            size = lru[relative][0] if relative in lru else self._entry_size(relative)
+            lru[relative] = [size, now]
+
+        total = sum(size for size, _ in lru.values())
+        if total > self.max_bytes:
+            for relative, (size, _) in sorted(lru.items(), key=lambda item: item[1][1]):
+                if total <= self.max_bytes:
+                    break
+                path = os.path.join(self.directory, relative)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                elif os.path.exists(path):
+                    os.remove(path)
+                del lru[relative]
+                total -= size
+                self.stats['evicted'] += 1
+        # Manifests whose function entries were evicted fail the existence check in load_manifest
+        _write_json_atomic(lru_path, lru)
+        return total
+
+    def format_stats(self):
+        stats = self.stats
+        return (f"--- CFG cache: {stats['file_hits']} files unchanged, {stats['file_misses']} reprocessed; "
+                f"functions {stats['hits']} hits / {stats['misses']} misses; {stats['evicted']} evicted ---")
@@ -0,0 +1,508 @@
+import argparse
+import ast
+import bisect
+import dis
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from cfg_backends import BACKENDS, visitor_cfg
+from cfg_builder import ENTRY, EXIT, dot_quote, iter_function_nodes
+
+# Pseudo line numbers of the function's entry and exit in recorded transitions
+ENTRY_LINE, EXIT_LINE = 0, -1
+MODES = ('trace', 'sample')
+DEFAULT_INTERVAL = 0.005
+# Line events recorded per sample with sys.monitoring
+BURST_LINES = 64
+# Edge widths run from 1 (never taken) to 1 + MAX_PENWIDTH (the hottest edge)
+MAX_PENWIDTH = 7.0
+COLD_COLOR = 'gray70'
+
+
+def _heat_color(fraction):
+    """Graphviz HSV colour from blue (fraction 0) to red (fraction 1)."""
+    return f"{0.66 * (1.0 - min(max(fraction, 0.0), 1.0)):.3f} 0.850 0.950"
+
+
+class _CallTrace:
+    """
+    Where one call of the profiled function is: its last line and when that line started.
+
+    Doubles as the call's sys.settrace local trace function.
+    """
+
+    __slots__ = ('profiler', 'line', 'time')
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.line = ENTRY_LINE
+        self.time = time.perf_counter()
+
+    def __call__(self, frame, event, arg):
+        if event == 'line':
+            self.profiler._step(self, frame.f_lineno)
+        elif event == 'return':  # Also sent when an exception leaves the function
+            self.profiler._step(self, EXIT_LINE)
+        return self
+
+
+class CFGProfiler:
+    """
+    Records which lines and line-to-line transitions of one function run, for overlaying on its CFG.
+
+    mode='trace' sees every line event of the function (and nothing else): hit counts, the
+    transitions between lines and the time spent on each line, callees included. It uses
+    sys.monitoring (Python 3.12+), which only instruments the profiled function's code, and
+    sys.settrace before that, which slows down all code running in the thread.
+
+    mode='sample' keeps the overhead in the low percents by only looking every `interval`
+    seconds. On Python 3.12+ each look is a burst: line events are switched on for the next
+    BURST_LINES lines of the function, which records hits, transitions and times like a short
+    trace. Before 3.12 a background thread reads the profiled thread's stack instead; that only
+    gives the line the function is on (no transitions), and as threads can only switch at
+    certain instructions, mostly a loop's header. Sampled values are only comparable with each
+    other, not with those of a trace.
+
+    Only calls made in the thread that called start() are recorded. Use as a context manager:
+
+        profiler = CFGProfiler(analyze_user_behavior)
+        with profiler:
+            analyze_user_behavior(users)
+        result = profiler.result()
+    """
+
+    def __init__(self, func, mode='trace', interval=DEFAULT_INTERVAL):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode '{mode}' (choose from {', '.join(MODES)})")
+        self.func = func
+        self.code = func.__code__
+        self.mode = mode
+        self.interval = interval
+        self.calls = 0
+        self.line_hits = Counter()
+        self.line_seconds = defaultdict(float)
+        self.transitions = Counter()
+        self.samples = 0
+        self.ticks = 0
+        self.seconds = 0.0
+        self.monitoring = hasattr(sys, 'monitoring')
+        self._started = None
+        self._thread_id = None
+        self._stop_event = None
+        self._sampler = None
+        self._monitoring_stack = []
+        self._burst = None
+        self._burst_left = 0
+        self._previous_trace = None
+
+    def _step(self, call, line):
+        now = time.perf_counter()
+        self.line_seconds[call.line] += now - call.time
+        self.transitions[call.line, line] += 1
+        if line != EXIT_LINE:
+            self.line_hits[line] += 1
+        call.line = line
+        call.time = now
+
+    # --- sys.settrace (Python < 3.12) ---
+
+    def _global_trace(self, frame, event, arg):
+        if frame.f_code is not self.code:
+            return None
+        self.calls += 1
+        return _CallTrace(self)
+
+    # --- sys.monitoring (Python 3.12+) ---
+
+    def _on_start(self, code, offset):
+        self.calls += 1
+        self._monitoring_stack.append(_CallTrace(self))
+
+    def _on_line(self, code, line):
+        if self._monitoring_stack:
+            self._step(self._monitoring_stack[-1], line)
+
+    def _on_return(self, code, offset, value):
+        if code is self.code and self._monitoring_stack:
+            self._step(self._monitoring_stack.pop(), EXIT_LINE)
+
+    def _on_burst_line(self, code, line):
+        call = self._burst
+        if call.line is None:  # First line of the burst: nothing to measure from yet
+            self.samples += 1
+            self.line_hits[line] += 1
+            call.line = line
+            call.time = time.perf_counter()
+        else:
+            self._step(call, line)
+        self._burst_left -= 1
+        if self._burst_left <= 0:
+            sys.monitoring.set_local_events(sys.monitoring.PROFILER_ID, self.code, 0)
+
+    def _on_burst_return(self, code, offset, value):
+        call = self._burst
+        if call.line is not None:
+            self._step(call, EXIT_LINE)
+            call.line = None  # The next line belongs to another call
+
+    def _monitoring_start(self, callbacks, local_events):
+        monitoring = sys.monitoring
+        tool = monitoring.PROFILER_ID
+        if monitoring.get_tool(tool) is not None:
+            raise RuntimeError(f"sys.monitoring profiler slot is taken by {monitoring.get_tool(tool)}")
+        monitoring.use_tool_id(tool, 'cfg_profile')
+        for event, callback in callbacks.items():
+            monitoring.register_callback(tool, event, callback)
+        monitoring.set_local_events(tool, self.code, local_events)
+
+    def _monitoring_stop(self):
+        monitoring = sys.monitoring
+        tool = monitoring.PROFILER_ID
+        monitoring.set_local_events(tool, self.code, 0)
+        monitoring.set_events(tool, 0)
+        for event in (monitoring.events.PY_START, monitoring.events.LINE, monitoring.events.PY_RETURN,
+                      monitoring.events.PY_UNWIND):
+            monitoring.register_callback(tool, event, None)
+        monitoring.free_tool_id(tool)
+
+    # --- Sampling ---
+
+    def _sample_bursts(self):
+        tool = sys.monitoring.PROFILER_ID
+        events = sys.monitoring.events.LINE | sys.monitoring.events.PY_RETURN
+        while not self._stop_event.wait(self.interval):
+            self.ticks += 1
+            if self._burst_left <= 0:
+                self._burst = _CallTrace(self)
+                self._burst.line = None
+                self._burst_left = BURST_LINES
+                sys.monitoring.set_local_events(tool, self.code, events)
+
+    def _sample_stacks(self):
+        code = self.code
+        thread_id = self._thread_id
+        # A frame that gave up the GIL mostly sits on a loop's back jump, which has no line
+        # (f_lineno is None); it is counted on the loop's header, other line-less instructions
+        # on the line before them
+        offset_lines = {}
+        for start, end, line in code.co_lines():
+            for offset in range(start, end, 2):
+                offset_lines[offset] = line
+        for instruction in dis.get_instructions(code):
+            if offset_lines.get(instruction.offset) is None and instruction.opname.startswith('JUMP_BACKWARD'):
+                offset_lines[instruction.offset] = offset_lines.get(instruction.argval)
+        line = None
+        for offset in sorted(offset_lines):
+            line = offset_lines[offset] = offset_lines[offset] or line
+        while not self._stop_event.wait(self.interval):
+            self.ticks += 1
+            frame = sys._current_frames().get(thread_id)
+            while frame is not None and frame.f_code is not code:
+                frame = frame.f_back
+            line = offset_lines.get(frame.f_lasti) if frame is not None else None
+            if line:
+                self.samples += 1
+                self.line_hits[line] += 1
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._started = time.perf_counter()
+        if self.mode == 'sample':
+            if self.monitoring:
+                events = sys.monitoring.events
+                self._burst_left = 0
+                self._monitoring_start({events.LINE: self._on_burst_line,
+                                        events.PY_RETURN: self._on_burst_return}, 0)
+            self._stop_event = threading.Event()
+            self._sampler = threading.Thread(target=self._sample_bursts if self.monitoring else self._sample_stacks,
+                                             name='cfg-profile-sampler', daemon=True)
+            self._sampler.start()
+        elif self.monitoring:
+            events = sys.monitoring.events
+            self._monitoring_start({events.PY_START: self._on_start, events.LINE: self._on_line,
+                                    events.PY_RETURN: self._on_return, events.PY_UNWIND: self._on_return},
+                                   events.PY_START | events.LINE | events.PY_RETURN)
+            sys.monitoring.set_events(sys.monitoring.PROFILER_ID, events.PY_UNWIND)  # Not a local event
+        else:
+            self._previous_trace = sys.gettrace()
+            sys.settrace(self._global_trace)
+
+    def stop(self):
+        if self.mode == 'sample':
+            self._stop_event.set()
+            self._sampler.join()
+        if self.monitoring:
+            self._monitoring_stop()
+        elif self.mode == 'trace':  # Only the tracer without sys.monitoring replaced sys.settrace
+            sys.settrace(self._previous_trace)
+        self.seconds += time.perf_counter() - self._started
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def result(self):
+        """
+        The raw counts, with line numbers of the function's source file.
+
+        Returns:
+            dict: 'mode', 'calls' (0 in sample mode), 'seconds' (profiled wall time), 'samples'
+            (bursts or stack samples), 'line_hits' and 'line_seconds' (line -> value) and
+            'transitions' ((from line, to line) -> count, with ENTRY_LINE / EXIT_LINE for the
+            function's entry and exit; empty when sampling stacks).
+        """
+        line_seconds = self.line_seconds
+        if self.mode == 'sample' and not self.monitoring:
+            # Samples are taken less often than asked while the profiled thread holds the GIL
+            per_sample = self.seconds / self.ticks if self.ticks else 0.0
+            line_seconds = {line: count * per_sample for line, count in self.line_hits.items()}
+        return {
+            'mode': self.mode,
+            'calls': self.calls,
+            'seconds': self.seconds,
+            'samples': self.samples,
+            'line_hits': dict(self.line_hits),
+            'line_seconds': {line: seconds for line, seconds in line_seconds.items() if line > 0},
+            'transitions': dict(self.transitions),
+        }
+
+
+def find_function_node(func):
+    """
+    Parses the file a function was defined in and returns (qualified name, function node, code lines).
+
+    Raises:
+        ValueError: The function's definition cannot be found in its source file.
+    """
+    path = inspect.getsourcefile(func)
+    with open(path, 'rb') as f:
+        source = f.read().decode('utf-8')
+    tree = ast.parse(source, filename=path)
+    first_line = func.__code__.co_firstlineno
+    for qualname, func_node in iter_function_nodes(tree):
+        starts = [func_node.lineno] + [decorator.lineno for decorator in func_node.decorator_list]
+        if func_node.name == func.__name__ and first_line in starts:
+            return qualname, func_node, source.splitlines()
+    raise ValueError(f"Definition of {func.__qualname__} not found in {path}")
+
+
+def map_profile(graph, profile):
+    """
+    Spreads a profile's line counts over the nodes and edges of the function's CFG.
+
+    Each line belongs to the node with the smallest line range containing it (lines outside
+    every range, e.g. continuation lines, to the closest node above). A transition between lines
+    of two different nodes counts one pass over each edge and node of the connecting path, which
+    is the direct edge or a detour through line-less nodes such as joins. Transitions that no such path explains are counted in 'unmapped'.
+
+    Returns:
+        dict: 'node_hits' and 'node_seconds' (lists indexed by node id), 'edge_counts' (list
+        indexed by edge id) and 'unmapped'.
+    """
+    line_nodes, spans = {}, {}
+    for node in range(graph.node_count):
+        line, end_line = graph.lines[node], graph.end_lines[node]
+        if not line:
+            continue
+        for covered in range(line, end_line + 1):
+            if end_line - line < spans.get(covered, end_line - line + 1):
+                line_nodes[covered] = node
+                spans[covered] = end_line - line
+    mapped_lines = sorted(line_nodes)
+    entry = graph.kinds.index(ENTRY)
+    exit_node = graph.kinds.index(EXIT)
+
+    def node_of(line):
+        if line == ENTRY_LINE:
+            return entry
+        if line == EXIT_LINE:
+            return exit_node
+        node = line_nodes.get(line)
+        if node is None:
+            position = bisect.bisect_right(mapped_lines, line)
+            node = line_nodes[mapped_lines[position - 1]] if position else entry
+        return node
+
+    successors = defaultdict(list)
+    for edge, (source, target) in enumerate(zip(graph.edge_src, graph.edge_dst)):
+        successors[source].append((target, edge))
+    paths = {}
+
+    def path_between(source, target):
+        """Edge ids of the shortest path whose inner nodes have no source line, or None."""
+        key = (source, target)
+        if key not in paths:
+            paths[key] = None
+            previous = {source: None}
+            queue = [source]
+            while queue and target not in previous:
+                next_queue = []
+                for node in queue:
+                    for successor, edge in successors[node]:
+                        if successor in previous:
+                            continue
+                        previous[successor] = (node, edge)
+                        if successor != target and not graph.lines[successor] and \
+                                graph.kinds[successor] not in (ENTRY, EXIT):
+                            next_queue.append(successor)
+                queue = next_queue
+            if target in previous:
+                edges, node = [], target
+                while previous[node] is not None:
+                    node, edge = previous[node]
+                    edges.append(edge)
+                paths[key] = edges[::-1]
+        return paths[key]
+
+    node_hits = [0] * graph.node_count
+    node_seconds = [0.0] * graph.node_count
+    edge_counts = [0] * graph.edge_count
+    unmapped = 0
+    node_hits[entry] = profile['calls']
+    for line, seconds in profile['line_seconds'].items():
+        node_seconds[node_of(line)] += seconds
+    for (from_line, to_line), count in profile['transitions'].items():
+        source, target = node_of(from_line), node_of(to_line)
+        if source == target:
+            continue
+        node_hits[target] += count
+        path = path_between(source, target)
+        if path is None:
+            unmapped += count
+            continue
+        for edge in path:
+            edge_counts[edge] += count
+        for edge in path[:-1]:  # The line-less nodes passed on the way
+            node_hits[graph.edge_dst[edge]] += count
+    if not profile['transitions']:  # Stack samples say where the time went, not how often nodes ran
+        for line, count in profile['line_hits'].items():
+            node_hits[node_of(line)] += count
+    return {'node_hits': node_hits, 'node_seconds': node_seconds, 'edge_counts': edge_counts, 'unmapped': unmapped}
+
+
+def heat_dot(graph, heat, names=None, graph_attributes='rankdir=LR'):
+    """
+    DOT source of the CFG with the profile drawn on it.
+
+    Nodes are filled from blue (cold) to red by their share of the time (hit counts when no time
+    was recorded) and labelled with their hits and milliseconds; edges get thicker and redder the
+    more often they were taken, and grey when never. Node ids are `names` (e.g. CFGVisitor's
+    "node_7") when given, else the graph's numeric ids.
+    """
+    names = names or [str(node) for node in range(graph.node_count)]
+    node_seconds, node_hits, edge_counts = heat['node_seconds'], heat['node_hits'], heat['edge_counts']
+    weights = node_seconds if any(node_seconds) else node_hits
+    hottest_node = max(weights, default=0) or 1
+    hottest_edge = max(edge_counts, default=0) or 1
+    out = [f"digraph {dot_quote(graph.name)} {{", f"\tgraph [{graph_attributes}]",
+           "\tnode [style=\"rounded,filled\" shape=box]"]
+    for node in range(graph.node_count):
+        label = f"{graph.label(node)}\n{node_hits[node]}x, {node_seconds[node] * 1000:.1f} ms"
+        color = _heat_color(weights[node] / hottest_node) if weights[node] else 'white'
+        out.append(f"\t{dot_quote(names[node])} [label={dot_quote(label)} fillcolor={dot_quote(color)}]")
+    values = graph.edge_label_values
+    for edge, (source, target, code) in enumerate(zip(graph.edge_src, graph.edge_dst, graph.edge_labels)):
+        count = edge_counts[edge]
+        label = f"{values[code]} ({count})" if values[code] else str(count)
+        if count:
+            style = f"penwidth={1 + MAX_PENWIDTH * count / hottest_edge:.2f} color={dot_quote(_heat_color(count / hottest_edge))}"
+        else:
+            style = f"color={COLD_COLOR} style=dashed"
+        out.append(f"\t{dot_quote(names[source])} -> {dot_quote(names[target])} [label={dot_quote(label)} {style}]")
+    out.append("}")
+    return "\n".join(out) + "\n"
+
+
+def profile_json(graph, heat, profile, names=None):
+    """JSON-ready summary: the profile's per-line counts plus the per-node and per-edge heat."""
+    names = names or [str(node) for node in range(graph.node_count)]
+    values = graph.edge_label_values
+    return {
+        'function': graph.name,
+        'mode': profile['mode'],
+        'calls': profile['calls'],
+        'seconds': profile['seconds'],
+        'samples': profile['samples'],
+        'unmapped_transitions': heat['unmapped'],
+        'nodes': [{'id': names[node], 'label': graph.label(node), 'line': graph.lines[node],
+                   'end_line': graph.end_lines[node], 'hits': heat['node_hits'][node],
+                   'seconds': heat['node_seconds'][node]} for node in range(graph.node_count)],
+        'edges': [{'source': names[source], 'target': names[target], 'label': values[code],
+                   'count': heat['edge_counts'][edge]}
+                  for edge, (source, target, code) in enumerate(zip(graph.edge_src, graph.edge_dst, graph.edge_labels))],
+        'lines': {str(line): {'hits': profile['line_hits'].get(line, 0), 'seconds': profile['line_seconds'].get(line, 0.0)}
+                  for line in sorted(set(profile['line_hits']) | set(profile['line_seconds']))},
+    }
+
+
+# Main execution
+if __name__ == "__main__":
+    import importlib
+
+    from user_stream import iter_jsonl_records
+
+    parser = argparse.ArgumentParser(description="Profile a function on real input and draw the hot paths on its CFG.")
+    parser.add_argument('input', nargs='?', help="JSONL file of users (default: generated users, see --users)")
+    parser.add_argument('--target', default='user_analysis:analyze_user_behavior',
+                        help="module:function to profile; it is called with the list of records")
+    parser.add_argument('--mode', choices=MODES, default='trace', help="trace every line, or sample the stack")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help="seconds between samples")
+    parser.add_argument('--backend', default='visitor-bb', choices=list(BACKENDS),
+                        help="CFG the profile is drawn on (default: CFGVisitor in basic-block mode)")
+    parser.add_argument('--users', type=int, default=100000, help="generated users when no input is given")
+    parser.add_argument('--repeat', type=int, default=3, help="runs with and without the profiler (best is kept)")
+    parser.add_argument('--output-dir', default='cfg_output', help="where the .gv and .json files are written")
+    args = parser.parse_args()
+
+    module_name, _, function_name = args.target.partition(':')
+    func = getattr(importlib.import_module(module_name), function_name)
+    if args.input:
+        records = [record for _, record in iter_jsonl_records(args.input)]
+    else:
+        from benchmark import generate_users
+        records = generate_users(args.users)
+
+    baseline = profiled = float('inf')
+    profiler = CFGProfiler(func, args.mode, args.interval)
+    for _ in range(max(args.repeat, 1)):
+        started = time.perf_counter()
+        func(records)
+        baseline = min(baseline, time.perf_counter() - started)
+        started = time.perf_counter()
+        with profiler:
+            func(records)
+        profiled = min(profiled, time.perf_counter() - started)
+    profile = profiler.result()
+
+    qualname, func_node, code_lines = find_function_node(func)
+    if args.backend.startswith('visitor'):
+        graph, names = visitor_cfg(func_node, code_lines, args.backend == 'visitor-bb')
+    else:
+        graph, names = BACKENDS[args.backend](func_node, code_lines), None
+    heat = map_profile(graph, profile)
+    os.makedirs(args.output_dir, exist_ok=True)
+    base = os.path.join(args.output_dir, f"{qualname.replace('<locals>', 'locals')}_profile")
+    with open(base + '.gv', 'w', encoding='utf-8') as f:
+        f.write(heat_dot(graph, heat, names))
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump(profile_json(graph, heat, profile, names), f, indent=2)
+
+    engine = 'sys.monitoring' if args.mode == 'trace' and hasattr(sys, 'monitoring') else \
+        'sys.settrace' if args.mode == 'trace' else f"sampling every {args.interval * 1000:g} ms"
+    print(f"{qualname} ({engine}): {len(records)} records, {baseline:.3f}s plain, {profiled:.3f}s profiled "
+          f"({(profiled / baseline - 1) * 100:+.1f}% overhead)")
+    hottest = sorted(range(graph.node_count), key=lambda node: heat['node_seconds'][node], reverse=True)[:5]
+    for node in hottest:
+        print(f"  {heat['node_hits'][node]:>10}x {heat['node_seconds'][node] * 1000:>9.1f} ms  "
+              f"{graph.label(node).splitlines()[0]}")
+    if heat['unmapped']:
+        print(f"  {heat['unmapped']} line transitions did not match a CFG edge")
+    print(f"--- Heat map written to {base}.gv and {base}.json ---")
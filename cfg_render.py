@@ -0,0 +1,297 @@
+import argparse
+import ast
+import os
+import subprocess
+import time
+from array import array
+
+from cfg_builder import KIND_ATTRIBUTES, build_function_cfg, dot_quote, iter_function_nodes
+from generate_ast_cfg import render_formats
+
+FALLBACK_ENGINES = ('sfdp', 'neato')
+SUMMARY_ATTRIBUTES = 'shape=folder style=filled fillcolor=lightgrey'
+DEFAULT_BUDGET = 30.0
+# Least time a split view gets, so Graphviz start-up does not eat a tiny share of the budget
+MIN_VIEW_SECONDS = 0.5
+
+
+def _region_label(graph, region):
+    return f"L{graph.region_lines[region]}: {graph.region_texts[region]}"
+
+
+def _node_line(graph, node):
+    return f"{node} [label={dot_quote(graph.label(node))} {KIND_ATTRIBUTES[graph.kinds[node]]}]"
+
+
+def _summary_line(graph, region, size):
+    label = f"{_region_label(graph, region)}\n(+{size} nodes)"
+    return f"r{region} [label={dot_quote(label)} {SUMMARY_ATTRIBUTES}]"
+
+
+def _edge_line(source, target, label):
+    return f"{source} -> {target} [label={dot_quote(label)}]" if label else f"{source} -> {target}"
+
+
+def region_sizes(graph):
+    """Number of nodes in every region, nested regions included."""
+    sizes = array('i', [0]) * graph.region_count
+    for region in graph.node_regions:
+        if region >= 0:
+            sizes[region] += 1
+    parents = graph.region_parents
+    for region in range(graph.region_count - 1, -1, -1):  # Children always have larger ids
+        if parents[region] >= 0:
+            sizes[parents[region]] += sizes[region]
+    return sizes
+
+
+def _format_view(graph, cluster_parents, contents, edges, graph_attributes):
+    """
+    Writes out a view: `contents` maps a cluster (region id, -1 for the top level) to its node
+    lines, `cluster_parents` maps every cluster to draw to the cluster it sits in.
+    """
+    children = {}
+    for region, parent in cluster_parents.items():
+        children.setdefault(parent, []).append(region)
+    out = [f"digraph {dot_quote(graph.name)} {{", f"\tgraph [{graph_attributes}]"]
+    # Nested clusters are written with an explicit stack, as regions can nest thousands deep
+    stack = [(-1, 1)]
+    while stack:
+        region, depth = stack.pop()
+        tabs = "\t" * depth
+        if region is None:
+            out.append(tabs + "}")
+            continue
+        if region >= 0:
+            out.append(f"{tabs}subgraph cluster_{region} {{")
+            out.append(f"{tabs}\tlabel={dot_quote(_region_label(graph, region))}")
+            stack.append((None, depth))
+            depth += 1
+            tabs += "\t"
+        out.extend(tabs + line for line in contents.get(region, ()))
+        stack.extend((child, depth) for child in reversed(sorted(children.get(region, ()))))
+    out.extend("\t" + line for line in edges)
+    out.append("}")
+    return "\n".join(out) + "\n"
+
+
+def view_dot(graph, root=-1, max_depth=None, clusters=True, graph_attributes='rankdir=LR'):
+    """
+    DOT source of a CFG (or one region of it) with its regions drawn as nested clusters.
+
+    Args:
+        graph (cfg_builder.CFGGraph): The graph.
+        root (int): Region to show, -1 for the whole function. Nodes outside it are left out.
+        max_depth (int | None): Level of detail. Regions nested deeper than this below `root`
+            are collapsed, each subtree into one summary node labelled with its header and size;
+            None shows every node.
+        clusters (bool): Draw the regions that are kept as clusters.
+        graph_attributes (str): DOT attributes of the graph.
+
+    Returns:
+        str: The DOT source.
+    """
+    parents = graph.region_parents
+    region_count = graph.region_count
+    # Depth below `root` and membership, in one pass since a parent always comes before its children
+    depth = array('i', [0]) * region_count
+    inside = bytearray(region_count)
+    collapsed_into = array('i', [-1]) * region_count
+    for region in range(region_count):
+        parent = parents[region]
+        if region == root:
+            inside[region] = 1
+        elif (parent < 0 and root < 0) or (parent >= 0 and inside[parent]):
+            inside[region] = 1
+            depth[region] = depth[parent] + 1 if parent >= 0 else 1
+            if parent >= 0 and collapsed_into[parent] >= 0:
+                collapsed_into[region] = collapsed_into[parent]
+            elif max_depth is not None and depth[region] > max_depth:
+                collapsed_into[region] = region
+
+    cluster_parents = {}
+    if clusters:
+        for region in range(region_count):
+            if inside[region] and collapsed_into[region] < 0:
+                parent = parents[region]
+                cluster_parents[region] = parent if parent >= 0 and inside[parent] else -1
+
+    def cluster_of(region):
+        return region if region in cluster_parents else -1
+
+    # names[i] is the DOT name node i is drawn as (its own id or its summary), None when left out
+    names = [None] * graph.node_count
+    sizes = {}
+    contents = {}
+    for node, region in enumerate(graph.node_regions):
+        if region < 0:
+            if root >= 0:
+                continue
+        elif not inside[region]:
+            continue
+        elif collapsed_into[region] >= 0:
+            summary = collapsed_into[region]
+            names[node] = f"r{summary}"
+            sizes[summary] = sizes.get(summary, 0) + 1
+            continue
+        names[node] = str(node)
+        contents.setdefault(cluster_of(region), []).append(_node_line(graph, node))
+    for summary, size in sizes.items():
+        contents.setdefault(cluster_of(parents[summary]), []).append(_summary_line(graph, summary, size))
+
+    edges = {}
+    values = graph.edge_label_values
+    for source, target, label in zip(graph.edge_src, graph.edge_dst, graph.edge_labels):
+        a, b = names[source], names[target]
+        if a is None or b is None or (a == b and a[0] == 'r'):
+            continue  # Outside the view, or inside one summary node
+        edges.setdefault((a, b), values[label])
+    edge_lines = [_edge_line(a, b, label) for (a, b), label in edges.items()]
+    return _format_view(graph, cluster_parents, contents, edge_lines, graph_attributes)
+
+
+def iter_region_views(graph, graph_attributes='rankdir=LR'):
+    """
+    Splits a CFG into one small view per region, in linear time.
+
+    The first view (region -1) is the function level with every top-level region collapsed; the
+    view of region r shows r's own nodes with the regions nested in it collapsed. Every edge is
+    drawn once, in the view of the innermost region holding both of its ends.
+
+    Yields:
+        tuple: (region, DOT source).
+    """
+    parents = graph.region_parents
+    node_regions = graph.node_regions
+    depth = array('i', [0]) * graph.region_count
+    for region in range(graph.region_count):
+        depth[region] = depth[parents[region]] + 1 if parents[region] >= 0 else 1
+    sizes = region_sizes(graph)
+
+    def region_depth(region):
+        return depth[region] if region >= 0 else 0
+
+    view_edges = {}
+    values = graph.edge_label_values
+    for source, target, label in zip(graph.edge_src, graph.edge_dst, graph.edge_labels):
+        # Walk both ends up to their common region, remembering what each end is drawn as there
+        a, b = node_regions[source], node_regions[target]
+        name_a, name_b = str(source), str(target)
+        while region_depth(a) > region_depth(b):
+            name_a, a = f"r{a}", parents[a]
+        while region_depth(b) > region_depth(a):
+            name_b, b = f"r{b}", parents[b]
+        while a != b:
+            name_a, a = f"r{a}", parents[a]
+            name_b, b = f"r{b}", parents[b]
+        if name_a == name_b and name_a[0] == 'r':
+            continue
+        view_edges.setdefault(a, {}).setdefault((name_a, name_b), values[label])
+
+    own_nodes = {}
+    for node, region in enumerate(node_regions):
+        own_nodes.setdefault(region, []).append(_node_line(graph, node))
+    nested = {}
+    for region in range(graph.region_count):
+        nested.setdefault(parents[region], []).append(_summary_line(graph, region, sizes[region]))
+
+    for view in range(-1, graph.region_count):
+        cluster_parents = {view: -1} if view >= 0 else {}
+        contents = {view: own_nodes.get(view, []) + nested.get(view, [])}
+        edge_lines = [_edge_line(a, b, label) for (a, b), label in view_edges.get(view, {}).items()]
+        yield view, _format_view(graph, cluster_parents, contents, edge_lines, graph_attributes)
+
+
+def render(graph, base, formats=('svg',), engine='dot', budget=DEFAULT_BUDGET, max_depth=None,
+           fallback_engines=FALLBACK_ENGINES, split=False):
+    """
+    Renders a CFG with clusters, keeping the total Graphviz time within a budget.
+
+    The clustered view is laid out with `engine`, then with each fallback engine. Each try gets
+    an equal share of what is left of the budget, with one share kept back for the last resort:
+    splitting the graph into one file per region (see iter_region_views), written as
+    `base`_r<region>.<format> next to the `base` overview. Each view gets an equal share of the
+    remaining budget (at least MIN_VIEW_SECONDS); views that do not make it are written as DOT
+    source only ('gv').
+
+    Args:
+        graph (cfg_builder.CFGGraph): The graph.
+        base (str): Output path without the extension.
+        formats (sequence): Graphviz output formats.
+        engine (str): Preferred layout program.
+        budget (float): Seconds of layout time for the whole call.
+        max_depth (int | None): Level of detail, see view_dot.
+        fallback_engines (sequence): Faster layout programs to try next.
+        split (bool): Go straight to one file per region.
+
+    Returns:
+        dict: 'engine' (the program that produced the output, None when it was split),
+        'outputs' (paths), 'timed_out' (programs that ran out of time) and 'seconds'.
+    """
+    started = time.monotonic()
+    deadline = started + budget
+    dot_source = view_dot(graph, max_depth=max_depth)
+    candidates = [] if split else [engine] + [fallback for fallback in fallback_engines if fallback != engine]
+    report = {'engine': None, 'outputs': [], 'timed_out': [], 'seconds': 0.0}
+    for tries_left, candidate in zip(range(len(candidates), 0, -1), candidates):
+        timeout = (deadline - time.monotonic()) / (tries_left + 1)
+        try:
+            report['outputs'] = render_formats(dot_source, base, formats, candidate, timeout=timeout)
+            report['engine'] = candidate
+            break
+        except subprocess.TimeoutExpired:
+            report['timed_out'].append(candidate)
+
+    if report['engine'] is None:
+        views_left = graph.region_count + 1
+        for region, view_source in iter_region_views(graph):
+            view_base = base if region < 0 else f"{base}_r{region}"
+            remaining = deadline - time.monotonic()
+            views_left -= 1
+            if remaining > 0:
+                try:
+                    timeout = min(remaining, max(remaining / (views_left + 1), MIN_VIEW_SECONDS))
+                    report['outputs'] += render_formats(view_source, view_base, formats, engine, timeout=timeout)
+                    continue
+                except subprocess.TimeoutExpired:
+                    report['timed_out'].append(f"{engine} ({os.path.basename(view_base)})")
+            report['outputs'] += render_formats(view_source, view_base, ['gv'])
+    report['seconds'] = time.monotonic() - started
+    return report
+
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render large CFGs with clusters, level of detail and a time budget.")
+    parser.add_argument('path', help="Python file to analyze")
+    parser.add_argument('--function', help="only this function (qualified name, e.g. MyClass.method)")
+    parser.add_argument('--output-dir', default='cfg_output', help="where the rendered files are written")
+    parser.add_argument('--format', nargs='+', default=['svg'], dest='formats', help="Graphviz output formats")
+    parser.add_argument('--engine', default='dot', help="preferred Graphviz layout program")
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help="layout seconds per function")
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help="collapse regions nested deeper than this into summary nodes")
+    parser.add_argument('--split', action='store_true', help="always write one file per region")
+    args = parser.parse_args()
+
+    with open(args.path, 'rb') as f:
+        source = f.read().decode('utf-8')
+    code_lines = source.splitlines()
+    os.makedirs(args.output_dir, exist_ok=True)
+    rendered = 0
+    for qualname, func_node in iter_function_nodes(ast.parse(source, filename=args.path)):
+        if args.function and qualname != args.function:
+            continue
+        graph = build_function_cfg(func_node, code_lines)
+        base = os.path.join(args.output_dir, f"{qualname.replace('<locals>', 'locals')}_cfg")
+        try:
+            report = render(graph, base, args.formats, args.engine, args.budget, args.max_depth, split=args.split)
+        except (OSError, RuntimeError) as e:
+            print(f"{qualname}: rendering failed: {e}")
+            continue
+        rendered += 1
+        how = f"with {report['engine']}" if report['engine'] else f"split into {len(report['outputs'])} files"
+        timed_out = f" ({', '.join(report['timed_out'])} ran out of time)" if report['timed_out'] else ""
+        print(f"{qualname}: {graph.node_count} nodes rendered {how} in {report['seconds']:.2f}s{timed_out}")
+    if args.function and not rendered:
+        print(f"Error: function '{args.function}' not found in {args.path}.")
@@ -0,0 +1,256 @@
+import argparse
+import ast
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from radon.complexity import cc_visit_ast
+
+from cfg_cache import DEFAULT_MAX_BYTES, CFGCache
+from generate_ast_cfg import (_cache_options, _output_base, _relative_name, build_cfg, iter_functions,
+                              iter_python_files, radon_complexities, render_formats, write_index)
+
+DEFAULT_POLL_INTERVAL = 0.25
+# A file must stay unchanged this long before it is rebuilt, so an editor's save burst counts once
+DEFAULT_DEBOUNCE = 0.1
+
+
+def _file_signature(path):
+    """(mtime, size) of a file, or None when it is gone."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class CFGWatcher:
+    """
+    Keeps the CFGs and complexity of a source tree up to date as files change.
+
+    Everything the batch run (generate_ast_cfg.analyze_tree) recomputes on every start stays in
+    memory: per file its source text and, per function, the source it was built from, its index
+    entry and its DOT source. A changed file is parsed again, but only functions whose source or
+    first line changed are rebuilt and re-rendered; the line number counts because it appears
+    in the node labels. Renders run on a thread pool, as Graphviz runs in its own process.
+
+    With a CFGCache, functions that are not in memory (at startup, or after a restart) are first
+    looked up in the cache, so restarting the watcher does not re-render an unchanged tree.
+    """
+
+    def __init__(self, root, output_dir, formats=('dot',), basic_blocks=False, cache=None, workers=None):
+        self.root = root
+        self.output_dir = output_dir
+        self.formats = list(formats)
+        self.basic_blocks = basic_blocks
+        self.cache = cache
+        self.options = _cache_options(self.formats, basic_blocks)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.signatures = {}
+        self.files = {}
+        self.stats = {'files': 0, 'rebuilt': 0, 'kept': 0, 'removed': 0, 'errors': 0}
+
+    def poll(self):
+        """Returns the files added, changed or deleted since the last poll."""
+        current = {}
+        for path in iter_python_files(self.root):
+            signature = _file_signature(path)
+            if signature is not None:
+                current[path] = signature
+        changed = {path for path, signature in current.items() if self.signatures.get(path) != signature}
+        changed.update(path for path in self.signatures if path not in current)
+        self.signatures = current
+        return changed
+
+    def _remove_outputs(self, functions):
+        for function in functions:
+            for output in function['entry']['outputs']:
+                try:
+                    os.remove(output)
+                except OSError:
+                    pass
+            self.stats['removed'] += 1
+
+    def _build(self, function, code_lines, func_node, radon_score):
+        """Builds and renders one function's CFG, or restores it from the cache; runs on the thread pool."""
+        entry = function['entry']
+        try:
+            meta = self.cache.load(function['key']) if self.cache is not None else None
+            if meta is not None:
+                function['dot_source'] = meta['dot_source']
+                entry['complexity'] = meta['complexity']
+                entry['outputs'] = self.cache.restore(function['key'], meta['artifacts'], function['base'])
+                return
+            dot, graph_complexity = build_cfg(func_node, code_lines, self.basic_blocks)
+            entry['complexity'] = radon_score if graph_complexity is None else graph_complexity
+            function['dot_source'] = dot.source
+            os.makedirs(os.path.dirname(function['base']), exist_ok=True)
+            entry['outputs'] = render_formats(dot.source, function['base'], self.formats)
+            if self.cache is not None:
+                self.cache.store(function['key'], {'function': entry['function'], 'complexity': entry['complexity'],
+                                                   'radon_complexity': radon_score, 'dot_source': dot.source},
+                                 entry['outputs'])
+        except Exception as e:  # One bad function must not stop the watcher
+            entry['error'] = f"{e.__class__.__name__}: {e}"
+
+    def _record_error(self, path, relative, source, error):
+        """Reports a file that cannot be read or parsed, keeping its last good graphs while it is being edited."""
+        state = self.files.setdefault(path, {'functions': {}})
+        state['source'] = source
+        state['error'] = {
+            'complexity': None, 'radon_complexity': None, 'file': relative, 'function': None,
+            'lineno': None, 'outputs': [], 'error': f"{error.__class__.__name__}: {error}"}
+        self.stats['errors'] += 1
+
+    def update_file(self, path):
+        """
+        Brings one file's CFGs up to date with its current contents (or removes them).
+
+        Returns:
+            int: The number of functions rebuilt (or restored from the cache).
+        """
+        previous = self.files.get(path)
+        relative = _relative_name(path, self.root)
+        try:
+            with open(path, 'rb') as f:
+                source = f.read().decode('utf-8')
+        except FileNotFoundError:
+            if previous is not None:
+                self._remove_outputs(previous['functions'].values())
+                del self.files[path]
+            return 0
+        except (OSError, UnicodeDecodeError) as e:
+            self._record_error(path, relative, None, e)
+            return 0
+        if previous is not None and previous['source'] == source:  # Touched, not changed
+            return 0
+
+        try:
+            tree = ast.parse(source, filename=path)
+            radon_scores = radon_complexities(cc_visit_ast(tree)) if not self.basic_blocks else {}
+        except (SyntaxError, ValueError) as e:
+            self._record_error(path, relative, source, e)
+            return 0
+
+        code_lines = source.splitlines()
+        target_dir = os.path.join(self.output_dir, os.path.splitext(relative)[0])
+        old_functions = previous['functions'] if previous is not None else {}
+        functions = {}
+        builds = []
+        seen = set()
+        for qualname, func_node in iter_functions(tree):
+            base = _output_base(target_dir, qualname, func_node.lineno if qualname in seen else None)
+            seen.add(qualname)
+            function_source = "\n".join(code_lines[func_node.lineno - 1:func_node.end_lineno])
+            radon_score = radon_scores.get((func_node.lineno, func_node.name))
+            old = old_functions.get(base)
+            if old is not None and old['source'] == function_source and old['entry']['lineno'] == func_node.lineno \
+                    and not old['entry']['error']:
+                functions[base] = old
+                self.stats['kept'] += 1
+                continue
+            function = {
+                'base': base,
+                'source': function_source,
+                'key': self.cache.function_key(qualname, func_node.lineno, function_source, self.options)
+                if self.cache is not None else None,
+                'dot_source': None,
+                'entry': {'complexity': radon_score, 'radon_complexity': radon_score, 'file': relative,
+                          'function': qualname, 'lineno': func_node.lineno, 'outputs': [], 'error': None},
+            }
+            functions[base] = function
+            builds.append(self.executor.submit(self._build, function, code_lines, func_node, radon_score))
+        for future in builds:
+            future.result()
+        self._remove_outputs(function for base, function in old_functions.items() if base not in functions)
+        self.files[path] = {'source': source, 'functions': functions}
+        self.stats['rebuilt'] += len(builds)
+        return len(builds)
+
+    def entries(self):
+        """Index entries of every function (and of every file that does not parse), as analyze_tree sorts them."""
+        entries = []
+        for state in self.files.values():
+            entries.extend(function['entry'] for function in state['functions'].values())
+            if 'error' in state:
+                entries.append(state['error'])
+        entries.sort(key=lambda e: (-(e['complexity'] or 0), e['file'], e['lineno'] or 0))
+        return entries
+
+    def update(self, paths):
+        """Updates the given files, then rewrites the index. Returns the number of functions rebuilt."""
+        rebuilt = 0
+        for path in sorted(paths):
+            rebuilt += self.update_file(path)
+        self.stats['files'] += len(paths)
+        os.makedirs(self.output_dir, exist_ok=True)
+        write_index(self.entries(), self.output_dir)
+        if self.cache is not None:
+            self.cache.finish()
+        return rebuilt
+
+    def run(self, poll_interval=DEFAULT_POLL_INTERVAL, debounce=DEFAULT_DEBOUNCE, on_update=None):
+        """
+        Polls the tree forever (until KeyboardInterrupt) and updates changed files.
+
+        A file is updated once it has not changed for `debounce` seconds. After every batch,
+        on_update(paths, rebuilt, seconds) is called, where seconds is the time from the first
+        change seen in the batch to its rendered outputs.
+        """
+        pending = {}
+        while True:
+            now = time.monotonic()
+            for path in self.poll():
+                first_seen = pending.get(path, (now, now))[0]
+                pending[path] = (first_seen, now)
+            ready = [path for path, (_, last_seen) in pending.items() if now - last_seen >= debounce]
+            if ready:
+                first_seen = min(pending[path][0] for path in ready)
+                for path in ready:
+                    del pending[path]
+                rebuilt = self.update(ready)
+                if on_update is not None:
+                    on_update(ready, rebuilt, time.monotonic() - first_seen)
+            time.sleep(poll_interval)
+
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch a source tree and keep its CFGs and complexity index up to date.")
+    parser.add_argument('path', help="file or directory to watch")
+    parser.add_argument('--output-dir', default='cfg_output', help="where CFGs and the index are written")
+    parser.add_argument('--format', nargs='+', default=['dot'], dest='formats',
+                        help="Graphviz output formats, e.g. dot png svg ('gv' = unrendered source)")
+    parser.add_argument('--basic-blocks', action='store_true',
+                        help="one node per run of straight-line statements instead of one per AST node")
+    parser.add_argument('--poll', type=float, default=DEFAULT_POLL_INTERVAL, help="seconds between scans of the tree")
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE,
+                        help="seconds a file must stay unchanged before it is rebuilt")
+    parser.add_argument('--workers', type=int, default=None, help="parallel Graphviz renders")
+    parser.add_argument('--cache-dir', default='.cfg_cache', help="cache for unchanged functions across restarts")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_BYTES // 2**20, help="cache size limit in MiB")
+    parser.add_argument('--no-cache', action='store_true', help="keep results in memory only")
+    args = parser.parse_args()
+
+    cfg_cache = None if args.no_cache else CFGCache(args.cache_dir, args.cache_size * 2**20)
+    watcher = CFGWatcher(args.path, args.output_dir, args.formats, args.basic_blocks, cfg_cache, args.workers)
+
+    started = time.perf_counter()
+    changed = watcher.poll()
+    watcher.update(changed)
+    functions = sum(len(state['functions']) for state in watcher.files.values())
+    print(f"--- Loaded {len(changed)} files, {functions} functions in {time.perf_counter() - started:.2f}s; "
+          f"watching {args.path} ---")
+    if cfg_cache is not None:
+        print(cfg_cache.format_stats())
+
+    def report(paths, rebuilt, seconds):
+        names = ', '.join(_relative_name(path, args.path) for path in sorted(paths)[:3])
+        more = f" and {len(paths) - 3} more" if len(paths) > 3 else ''
+        print(f"{time.strftime('%H:%M:%S')} {names}{more}: {rebuilt} functions rebuilt, "
+              f"outputs updated {seconds * 1000:.0f} ms after the change was seen")
+
+    try:
+        watcher.run(args.poll, args.debounce, report)
+    except KeyboardInterrupt:
+        print(f"\n--- Stopped: {watcher.stats['rebuilt']} functions rebuilt, {watcher.stats['kept']} kept ---")
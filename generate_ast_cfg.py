@@ -1,7 +1,14 @@
+import argparse
 import ast
+import csv
 import graphviz
-from radon.complexity import cc_visit
+import json
+from concurrent.futures import ProcessPoolExecutor
+from radon.complexity import cc_visit_ast
 import os
+import subprocess
+
+from cfg_cache import DEFAULT_MAX_BYTES, CFGCache
 
 # --- Your Python code to analyze ---
 code_to_analyze = """
@@ -36,8 +43,14 @@ def analyze_user_behavior(users):
     return suspicious_users
 """
 
+# Statements that get their own node in basic-block mode; everything else is straight-line code
+# that is merged into the surrounding block (nested def/class statements included)
+CONTROL_FLOW_NODES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.Try, ast.With, ast.AsyncWith, ast.Return) + \
+    ((ast.Match,) if hasattr(ast, 'Match') else ()) + ((ast.TryStar,) if hasattr(ast, 'TryStar') else ())
+
+
 class CFGVisitor(ast.NodeVisitor):
-    def __init__(self, dot_graph, code_lines):
+    def __init__(self, dot_graph, code_lines, basic_blocks=False):
         self.dot = dot_graph
         self.node_counter = 0
         self.current_node = None
@@ -45,6 +58,12 @@ class CFGVisitor(ast.NodeVisitor):
         self.loop_stack = []
         self.code_lines = code_lines
         self.function_exit_node_id = None
+        # Basic-block mode: one node per run of straight-line statements, none for expressions
+        self.basic_blocks = basic_blocks
+        self.open_block = None
+        self.block_labels = {}
+        self.block_edges = {}
+        self.complexity = None
 
     def new_node(self, label, shape='box', style='rounded', color='black', fillcolor=None):
         node_id = f"node_{self.node_counter}"
@@ -56,10 +75,59 @@ class CFGVisitor(ast.NodeVisitor):
         return node_id
 
     def add_edge(self, source, target, label=''):
+        # After a return there is no current node, so there is nothing to connect from
+        if source is None or target is None:
+            return
+        if self.basic_blocks:
+            # Collapse the duplicate and self edges the visit_* methods add; a labelled edge wins
+            if source != target and not self.block_edges.get((source, target)):
+                self.block_edges[(source, target)] = label
+            return
         self.dot.edge(source, target, label=label)
 
-    def visit(self, node):
-        old_current_node = self.current_node
+    def new_block(self, label):
+        """Starts a basic block; its node (like every edge) is emitted by flush_blocks at the end."""
+        node_id = f"node_{self.node_counter}"
+        self.node_counter += 1
+        self.block_labels[node_id] = [label]
+        self.open_block = node_id
+        return node_id
+
+    def graph_complexity(self):
+        """
+        Cyclomatic complexity of the basic-block graph: E - N + 2P.
+
+        P (connected components, normally 1) is found with a union-find over the edges.
+        """
+        parent = list(range(self.node_counter))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        components = self.node_counter
+        for source, target in self.block_edges:
+            a, b = find(int(source[5:])), find(int(target[5:]))
+            if a != b:
+                parent[a] = b
+                components -= 1
+        return len(self.block_edges) - self.node_counter + 2 * components
+
+    def flush_blocks(self):
+        if self.basic_blocks:
+            self.complexity = self.graph_complexity()
+        for node_id, labels in self.block_labels.items():
+            self.dot.node(node_id, "\n".join(labels), shape='box', style='rounded', color='black')
+        for (source, target), label in self.block_edges.items():
+            self.dot.edge(source, target, label=label)
+        self.block_labels = {}
+        self.block_edges = {}
+        self.open_block = None
+
+    def node_label(self, node):
+        """Line number plus a snippet of the source, e.g. "L12: total += 1"."""
         start_line = getattr(node, 'lineno', None)
         end_line = getattr(node, 'end_lineno', start_line)
 
@@ -85,8 +153,13 @@ class CFGVisitor(ast.NodeVisitor):
                 node_label = f"L{start_line}: {node_label_base}"
         else:
             node_label = f"<{node_label_base}>"
+        return node_label
 
-        node_id = self.new_node(node_label)
+    def visit(self, node):
+        if self.basic_blocks:
+            self.visit_basic_block(node)
+            return
+        node_id = self.new_node(self.node_label(node))
         if self.current_node:
             self.add_edge(self.current_node, node_id)
         self.current_node = node_id
@@ -97,6 +170,78 @@ class CFGVisitor(ast.NodeVisitor):
         visitor(node)
         pass
 
+    def visit_basic_block(self, node):
+        """visit() in basic-block mode."""
+        if not isinstance(node, ast.stmt):
+            return  # Expressions never get their own node
+        label = self.node_label(node)
+        if not isinstance(node, CONTROL_FLOW_NODES):
+            # Straight-line statement: extend the open block if control is still in it
+            if self.open_block is not None and self.current_node == self.open_block:
+                self.block_labels[self.open_block].append(label)
+                node._id = self.open_block
+                return
+            node_id = self.new_block(label)
+            self.add_edge(self.current_node, node_id)
+            self.current_node = node_id
+            node._id = node_id
+            return
+
+        node_id = self.new_node(label)
+        self.add_edge(self.current_node, node_id)
+        self.current_node = node_id
+        node._id = node_id
+        name = 'For' if isinstance(node, ast.AsyncFor) else node.__class__.__name__
+        visitor = getattr(self, 'visit_' + name, self.visit_compound)
+        visitor(node)
+
+    def visit_body(self, statements):
+        """
+        Visits a statement list (an if body, a loop body...).
+
+        The classic mode only follows the first statement; basic-block mode walks all of them.
+        """
+        if not self.basic_blocks:
+            self.visit(statements[0])
+            return
+        for stmt in statements:
+            self.visit(stmt)
+
+    def visit_compound(self, node):
+        """
+        Basic-block mode for try / with / match statements.
+
+        A with body and a try body plus its else block run straight after the header; every except
+        handler and match case branches off the header, and all of them join before a finally block.
+        A match without an irrefutable case (`case _:`) can also fall through from the header.
+        """
+        header_node_id = node._id
+        branch_exits = []
+        if hasattr(node, 'cases'):
+            if not any(case.guard is None and isinstance(case.pattern, ast.MatchAs) and case.pattern.pattern is None
+                       for case in node.cases):
+                branch_exits.append(header_node_id)
+            branches = [case.body for case in node.cases]
+        else:
+            self.current_node = header_node_id
+            self.visit_body(node.body)
+            self.visit_body(getattr(node, 'orelse', None) or [])
+            branch_exits.append(self.current_node)
+            branches = [handler.body for handler in getattr(node, 'handlers', [])]
+        for statements in branches:
+            self.current_node = header_node_id
+            self.visit_body(statements)
+            branch_exits.append(self.current_node)
+        if len(branch_exits) > 1:
+            join_node_id = self.new_node("END", shape='point', style='invis')
+            for exit_node_id in branch_exits:
+                self.add_edge(exit_node_id, join_node_id)
+            self.current_node = join_node_id
+        else:
+            self.current_node = branch_exits[0]
+        if getattr(node, 'finalbody', None):
+            self.visit_body(node.finalbody)
+
     def generic_visit(self, node):
         last_visited_child_node_id = None
         for field, value in ast.iter_fields(node):
@@ -142,12 +287,14 @@ class CFGVisitor(ast.NodeVisitor):
         for stmt in node.body:
             prev_current = self.current_node
             self.visit(stmt)
-            if prev_current is not None and stmt._id is not None:
+            # visit() already links basic blocks; a merged statement would get a self-loop here
+            if not self.basic_blocks and prev_current is not None and stmt._id is not None:
                 self.add_edge(prev_current, stmt._id)
 
         if self.current_node and self.current_node != self.function_exit_node_id:
             self.add_edge(self.current_node, self.function_exit_node_id)
         self.current_node = self.function_exit_node_id
+        self.flush_blocks()
 
     def visit_Return(self, node):
         return_node_id = node._id
@@ -167,7 +314,7 @@ class CFGVisitor(ast.NodeVisitor):
         # Handle the 'True' branch (if body)
         if node.body:
             self.current_node = test_node_id # Start from the test node
-            self.visit(node.body[0]) # Visit the first statement of the 'if' body
+            self.visit_body(node.body) # Visit the 'if' body
             if_body_entry_node_id = node.body[0]._id
             if_body_exit_node_id = self.current_node # This is the last node visited in the 'if' body
             self.add_edge(test_node_id, if_body_entry_node_id, label='True')
@@ -179,7 +326,7 @@ class CFGVisitor(ast.NodeVisitor):
         # Handle the 'False' branch (orelse body)
         if node.orelse:
             self.current_node = test_node_id # Reset current_node to the test for visiting the else part
-            self.visit(node.orelse[0]) # Visit the first statement of the 'else' body
+            self.visit_body(node.orelse) # Visit the 'else' body
             orelse_body_entry_node_id = node.orelse[0]._id
             orelse_body_exit_node_id = self.current_node # This is the last node visited in the 'else' body
             self.add_edge(test_node_id, orelse_body_entry_node_id, label='False')
@@ -203,7 +350,7 @@ class CFGVisitor(ast.NodeVisitor):
         # Loop body
         if node.body:
             self.current_node = loop_header_node_id
-            self.visit(node.body[0])
+            self.visit_body(node.body)
             loop_body_entry_node_id = node.body[0]._id
             loop_body_exit_node_id = self.current_node
             self.add_edge(loop_header_node_id, loop_body_entry_node_id, label='Enter Loop')
@@ -214,7 +361,7 @@ class CFGVisitor(ast.NodeVisitor):
         # Loop else (executed if loop completes without a break)
         if node.orelse:
             self.current_node = loop_header_node_id
-            self.visit(node.orelse[0])
+            self.visit_body(node.orelse)
             loop_else_entry_node_id = node.orelse[0]._id
             loop_else_exit_node_id = self.current_node
             self.add_edge(loop_header_node_id, loop_else_entry_node_id, label='Else (No Break)')
@@ -226,6 +373,8 @@ class CFGVisitor(ast.NodeVisitor):
         # However, for full correctness with `break`/`continue` and complex flow, this needs more specific handling.
         # For now, we'll just ensure the subsequent statements are correctly attached.
         self.current_node = loop_header_node_id # This needs careful handling, for now setting to header
+        if self.basic_blocks and node.orelse:
+            self.current_node = loop_else_exit_node_id # The else block runs when the loop is exhausted
 
 
     def visit_While(self, node):
@@ -238,7 +387,7 @@ class CFGVisitor(ast.NodeVisitor):
         # Loop body
         if node.body:
             self.current_node = loop_header_node_id
-            self.visit(node.body[0])
+            self.visit_body(node.body)
             loop_body_entry_node_id = node.body[0]._id
             loop_body_exit_node_id = self.current_node
             self.add_edge(loop_header_node_id, loop_body_entry_node_id, label='True')
@@ -249,7 +398,7 @@ class CFGVisitor(ast.NodeVisitor):
         # Loop else (executed if loop completes without a break)
         if node.orelse:
             self.current_node = loop_header_node_id
-            self.visit(node.orelse[0])
+            self.visit_body(node.orelse)
             loop_else_entry_node_id = node.orelse[0]._id
             loop_else_exit_node_id = self.current_node
             self.add_edge(loop_header_node_id, loop_else_entry_node_id, label='False (Else)')
@@ -262,56 +411,410 @@ class CFGVisitor(ast.NodeVisitor):
         # However, for full correctness with `break`/`continue` and complex flow, this needs more specific handling.
         # For now, we'll just ensure the subsequent statements are correctly attached.
         self.current_node = loop_header_node_id # This needs careful handling, for now setting to header
+        if self.basic_blocks and node.orelse:
+            self.current_node = loop_else_exit_node_id # The else block runs when the loop is exhausted
+
+
+# --- Whole-codebase mode ---
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+# Nodes whose bodies can hold function definitions
+BLOCK_NODES = (ast.stmt, ast.excepthandler, ast.match_case)
+SKIP_DIRS = {'.git', '.hg', '.svn', '.tox', '.venv', 'venv', '__pycache__', 'node_modules', 'build', 'dist'}
+INDEX_FIELDS = ('complexity', 'radon_complexity', 'file', 'function', 'lineno', 'outputs', 'error')
+
+
+def iter_functions(node, prefix=''):
+    """
+    Yields every function and method under a node, including nested ones.
+
+    Args:
+        node (ast.AST): Usually the parsed module.
+        prefix (str): Qualified-name prefix for the functions found.
+
+    Yields:
+        tuple: (qualified name, function node), e.g. ("MyClass.method", node).
+    """
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, FUNCTION_NODES):
+            yield f"{prefix}{child.name}", child
+            yield from iter_functions(child, f"{prefix}{child.name}.<locals>.")
+        elif isinstance(child, ast.ClassDef):
+            yield from iter_functions(child, f"{prefix}{child.name}.")
+        elif isinstance(child, BLOCK_NODES):
+            yield from iter_functions(child, prefix)
+
+
+def radon_complexities(blocks):
+    """Maps (line number, name) -> complexity for every function and method radon reports."""
+    complexities = {}
+    for block in blocks:
+        if hasattr(block, 'methods'):  # A radon Class
+            complexities.update(radon_complexities(block.methods))
+            continue
+        complexities[(block.lineno, block.name)] = block.complexity
+        complexities.update(radon_complexities(block.closures))
+    return complexities
+
+
+def radon_only_decisions(func_node):
+    """
+    Counts the decision points radon scores that have no branch in a statement-level CFG.
+
+    These are boolean operators, conditional expressions, comprehensions, asserts, and the else
+    blocks of loops and try statements. Nested functions and classes are skipped, as radon does.
+    """
+    count = 0
+    stack = list(func_node.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        if isinstance(node, ast.Assert):
+            count += 1
+            continue  # radon does not look inside asserts
+        if isinstance(node, ast.BoolOp):
+            count += len(node.values) - 1
+        elif isinstance(node, ast.IfExp):
+            count += 1
+        elif isinstance(node, ast.comprehension):
+            count += len(node.ifs) + 1
+        elif isinstance(node, (ast.For, ast.AsyncFor, ast.While, ast.Try)) and node.orelse:
+            count += 1
+        stack.extend(ast.iter_child_nodes(node))
+    return count
+
+
+def build_cfg(func_node, code_lines, basic_blocks=False):
+    """
+    Builds the Graphviz CFG of one function with CFGVisitor (see CFGVisitor for `basic_blocks`).
+
+    Returns:
+        tuple: (graphviz.Digraph, complexity). The complexity is the graph's E - N + 2P plus
+        radon_only_decisions, so it is on radon's scale. It is None for classic graphs, which
+        only follow the first statement of nested bodies.
+    """
+    dot = graphviz.Digraph(comment='Control Flow Graph', graph_attr={'rankdir': 'LR'})
+    visitor = CFGVisitor(dot, code_lines, basic_blocks)
+    visitor.visit_FunctionDef(func_node)
+    if visitor.complexity is None:
+        return dot, None
+    return dot, visitor.complexity + radon_only_decisions(func_node)
+
+
+def render_formats(dot_source, base, formats, engine='dot', timeout=None):
+    """
+    Writes `base`.<format> for every format from a single Graphviz run, so the layout is computed once.
+
+    Args:
+        dot_source (str): The graph in DOT.
+        base (str): Output path without the extension.
+        formats (sequence): Graphviz output formats; 'gv' writes `dot_source` itself.
+        engine (str): Graphviz layout program.
+        timeout (float | None): Seconds to wait for Graphviz; on expiry it is killed and
+            subprocess.TimeoutExpired is raised.
+
+    Returns:
+        list: The output paths, in the order of `formats`.
+    """
+    outputs = []
+    command = [engine]
+    for fmt in formats:
+        path = f"{base}.{fmt}"
+        if fmt == 'gv':
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(dot_source)
+        else:
+            command += [f"-T{fmt}", f"-o{path}"]
+        outputs.append(path)
+    if len(command) > 1:
+        result = subprocess.run(command, input=dot_source.encode('utf-8'), capture_output=True, timeout=timeout)
+        if result.returncode:
+            raise RuntimeError(f"{engine} failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return outputs
+
+
+def iter_python_files(root):
+    """Yields the .py files under `root` (or `root` itself if it is a file), in a stable order."""
+    if os.path.isfile(root):
+        yield root
+        return
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith('.'))
+        for filename in sorted(filenames):
+            if filename.endswith('.py'):
+                yield os.path.join(dirpath, filename)
+
+
+def _relative_name(path, root):
+    return os.path.relpath(path, root) if os.path.isdir(root) else os.path.basename(path)
+
+
+def _cache_options(formats, basic_blocks, check_complexity=False):
+    """Everything besides the source that changes a function's outputs, for the cache keys."""
+    return list(formats) + ['basic-blocks'] * basic_blocks + ['check-complexity'] * check_complexity
+
+
+def _output_base(target_dir, qualname, lineno=None):
+    """Output path of a function's CFG files, without the extension."""
+    name = qualname.replace('<locals>', 'locals')
+    # Redefinitions (e.g. a property setter) get their line number so they do not overwrite each other
+    if lineno is not None:
+        name = f"{name}_L{lineno}"
+    return os.path.join(target_dir, f"{name}_cfg")
+
+
+def analyze_file(path, root, output_dir, formats, cache=None, file_key=None, basic_blocks=False,
+                 check_complexity=False):
+    """
+    Computes the complexity and renders the CFG of every function in one file.
+
+    The file is parsed once. With basic-block CFGs the complexity is read off the graph (see
+    build_cfg) and radon only runs, on the same AST, when `check_complexity` asks for it; classic
+    CFGs skip statements, so there the complexity is radon's. All formats of a CFG come out of a
+    single Graphviz run.
+
+    Runs in a worker process; errors are recorded in the returned entries instead of raised.
+
+    Args:
+        path (str): The Python file.
+        root (str): The directory the run started from, for relative names.
+        output_dir (str): Where the CFG files go (mirrors the source tree).
+        formats (list): Graphviz output formats, e.g. ['dot', 'png'];
+            'gv' writes the unrendered DOT source without calling Graphviz.
+        cache (CFGCache | None): Reuse and store per-function results in this cache.
+        file_key (str | None): The file's cache key; when given, a manifest of the file is
+            stored so the next run can skip it without parsing.
+        basic_blocks (bool): Build basic-block CFGs (one node per straight-line run of statements).
+        check_complexity (bool): Also record radon's score next to the CFG's, to compare them.
+
+    Returns:
+        list: One index entry (dict with INDEX_FIELDS) per function.
+    """
+    relative = _relative_name(path, root)
+    try:
+        with open(path, 'rb') as f:
+            source = f.read().decode('utf-8')
+        tree = ast.parse(source, filename=path)
+        radon_scores = radon_complexities(cc_visit_ast(tree)) if check_complexity or not basic_blocks else {}
+    except (SyntaxError, UnicodeDecodeError, ValueError) as e:
+        return [{'complexity': None, 'radon_complexity': None, 'file': relative, 'function': None,
+                 'lineno': None, 'outputs': [], 'error': f"{e.__class__.__name__}: {e}"}]
+
+    code_lines = source.splitlines()
+    target_dir = os.path.join(output_dir, os.path.splitext(relative)[0])
+    entries = []
+    manifest = []
+    seen = set()
+    for qualname, func_node in iter_functions(tree):
+        radon_score = radon_scores.get((func_node.lineno, func_node.name))
+        entry = {'complexity': radon_score, 'radon_complexity': radon_score, 'file': relative,
+                 'function': qualname, 'lineno': func_node.lineno, 'outputs': [], 'error': None}
+        base = _output_base(target_dir, qualname, func_node.lineno if qualname in seen else None)
+        seen.add(qualname)
+        key = meta = None
+        if cache is not None:
+            function_source = "\n".join(code_lines[func_node.lineno - 1:func_node.end_lineno])
+            key = cache.function_key(qualname, func_node.lineno, function_source,
+                                     _cache_options(formats, basic_blocks, check_complexity))
+            meta = cache.load(key)
+        try:
+            if meta is not None:
+                entry['complexity'] = meta['complexity']
+                entry['outputs'] = cache.restore(key, meta['artifacts'], base)
+            else:
+                dot, graph_complexity = build_cfg(func_node, code_lines, basic_blocks)
+                if graph_complexity is not None:
+                    entry['complexity'] = graph_complexity
+                os.makedirs(target_dir, exist_ok=True)
+                entry['outputs'] = render_formats(dot.source, base, formats)
+                if cache is not None:
+                    meta = cache.store(key, {'function': qualname, 'complexity': entry['complexity'],
+                                             'radon_complexity': radon_score, 'dot_source': dot.source},
+                                       entry['outputs'])
+        except Exception as e:  # One bad function must not stop the whole run
+            entry['error'] = f"{e.__class__.__name__}: {e}"
+        entries.append(entry)
+        if meta is not None:
+            manifest.append({'key': key, 'function': qualname, 'lineno': func_node.lineno,
+                             'complexity': entry['complexity'], 'radon_complexity': meta.get('radon_complexity'),
+                             'base': os.path.basename(base),
+                             'artifacts': meta['artifacts']})
+
+    # Files with errors are not recorded, so they are retried on the next run
+    if file_key is not None and len(manifest) == len(entries):
+        cache.store_manifest(file_key, manifest)
+    return entries
+
+
+def _restore_file(manifest, relative, output_dir, cache):
+    """Rebuilds the index entries of an unchanged file from its cache manifest."""
+    target_dir = os.path.join(output_dir, os.path.splitext(relative)[0])
+    return [{'complexity': function['complexity'], 'radon_complexity': function.get('radon_complexity'),
+             'file': relative, 'function': function['function'],
+             'lineno': function['lineno'], 'error': None,
+             'outputs': cache.restore(function['key'], function['artifacts'],
+                                      os.path.join(target_dir, function['base']))}
+            for function in manifest['functions']]
+
+
+def _analyze_file_task(task):
+    path, root, output_dir, formats, cache_config, file_key, basic_blocks, check_complexity = task
+    cache = CFGCache(*cache_config) if cache_config else None
+    entries = analyze_file(path, root, output_dir, formats, cache, file_key, basic_blocks, check_complexity)
+    return entries, (cache.stats, cache.touched) if cache else None
+
+
+def write_index(entries, output_dir):
+    """Writes the summary index entries, in the order given, as index.json and index.csv."""
+    json_path = os.path.join(output_dir, 'index.json')
+    with open(json_path, 'w') as f:
+        json.dump(entries, f, indent=2)
+    csv_path = os.path.join(output_dir, 'index.csv')
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=INDEX_FIELDS)
+        writer.writeheader()
+        for entry in entries:
+            writer.writerow({**entry, 'outputs': ';'.join(entry['outputs'])})
+    return json_path, csv_path
+
+
+def analyze_tree(root, output_dir, formats=('dot',), workers=None, cache=None, basic_blocks=False,
+                 check_complexity=False):
+    """
+    Runs the CFG and complexity analysis on every function of every .py file under `root`.
+
+    Files are spread over a process pool; each worker parses its file once, then scores, builds
+    and renders the CFGs itself, so every stage uses every core.
+
+    Args:
+        root (str): Directory (or single file) to analyze.
+        output_dir (str): Where the CFG files and the index go.
+        formats (sequence): Output formats, see analyze_file.
+        workers (int | None): Number of worker processes (defaults to the CPU count).
+        cache (CFGCache | None): When given, unchanged files are restored from the cache without
+            being parsed, and only functions whose source changed are rebuilt.
+        basic_blocks (bool): Build basic-block CFGs, see analyze_file.
+        check_complexity (bool): Record radon's score next to the CFG's, see analyze_file.
+
+    Returns:
+        list: All index entries, sorted by complexity (highest first).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    formats = list(formats)
+    cache_config = (cache.directory, cache.max_bytes, cache.version) if cache else None
+    tasks = []
+    entries = []
+    for path in iter_python_files(root):
+        file_key = None
+        if cache is not None:
+            with open(path, 'rb') as f:
+                file_key = cache.file_key(f.read(), _cache_options(formats, basic_blocks, check_complexity))
+            manifest = cache.load_manifest(file_key)
+            if manifest is not None:
+                cache.stats['hits'] += len(manifest['functions'])
+                entries.extend(_restore_file(manifest, _relative_name(path, root), output_dir, cache))
+                continue
+        tasks.append((path, root, output_dir, formats, cache_config, file_key, basic_blocks, check_complexity))
+
+    # Only start the pool when there is something to rebuild
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for file_entries, cache_report in executor.map(_analyze_file_task, tasks, chunksize=8):
+                entries.extend(file_entries)
+                if cache_report:
+                    cache.merge(*cache_report)
+    if cache is not None:
+        cache.finish()
+    entries.sort(key=lambda e: (-(e['complexity'] or 0), e['file'], e['lineno'] or 0))
+    write_index(entries, output_dir)
+    return entries
 
 
 # Main execution
 if __name__ == "__main__":
-    try:
-        tree = ast.parse(code_to_analyze)
-        code_lines = code_to_analyze.splitlines()
-
-        # --- Calculate Cyclomatic Complexity using Radon ---
-        complexity_results = cc_visit(code_to_analyze)
-        print("\n--- Cyclomatic Complexity (Radon) ---")
-        found_complexity = False
-        for func in complexity_results:
-            if func.name == "analyze_user_behavior":
-                print(f"Function: {func.name}, Complexity: {func.complexity}")
-                found_complexity = True
-                break
-        if not found_complexity:
-            print("Could not find complexity for 'analyze_user_behavior' function.")
-
-
-        # --- Visualize Control Flow Graph ---
-        dot = graphviz.Digraph(comment='Control Flow Graph', graph_attr={'rankdir': 'LR'})
-        visitor = CFGVisitor(dot, code_lines)
-
-        function_found_cfg = False
-        for node in ast.iter_child_nodes(tree):
-            if isinstance(node, ast.FunctionDef) and node.name == "analyze_user_behavior":
-                visitor.visit_FunctionDef(node)
-                function_found_cfg = True
-                break
+    parser = argparse.ArgumentParser(description="Cyclomatic complexity and CFGs for Python functions.")
+    parser.add_argument('path', nargs='?', help="file or directory to analyze (default: the built-in example)")
+    parser.add_argument('--output-dir', default='cfg_output', help="where CFGs and the index are written")
+    parser.add_argument('--format', nargs='+', default=['dot'], dest='formats',
+                        help="Graphviz output formats, e.g. dot png svg ('gv' = unrendered source)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--cache-dir', default='.cfg_cache', help="cache for unchanged functions")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_BYTES // 2**20, help="cache size limit in MiB")
+    parser.add_argument('--basic-blocks', action='store_true',
+                        help="one node per run of straight-line statements instead of one per AST node")
+    parser.add_argument('--check-complexity', action='store_true',
+                        help="with --basic-blocks, also run radon and report where it disagrees with the CFG")
+    parser.add_argument('--no-cache', action='store_true', help="rebuild everything and leave the cache alone")
+    args = parser.parse_args()
+
+    if args.path:
+        cfg_cache = None if args.no_cache else CFGCache(args.cache_dir, args.cache_size * 2**20)
+        results = analyze_tree(args.path, args.output_dir, args.formats, args.workers, cfg_cache,
+                               args.basic_blocks, args.check_complexity)
+        failed = [entry for entry in results if entry['error']]
+        print(f"\n--- Analyzed {len(results) - len(failed)} functions under {args.path} ---")
+        for entry in results[:10]:
+            if not entry['error']:
+                print(f"{entry['complexity'] or '?':>4}  {entry['file']}:{entry['lineno']} {entry['function']}")
+        if failed:
+            print(f"{len(failed)} functions or files failed, see the 'error' column of the index.")
+        if args.basic_blocks and args.check_complexity:
+            # radon has no score for methods of classes nested in functions
+            mismatches = [entry for entry in results if not entry['error'] and entry['radon_complexity'] is not None
+                          and entry['complexity'] != entry['radon_complexity']]
+            print(f"CFG complexity differs from radon for {len(mismatches)} functions:")
+            for entry in mismatches[:10]:
+                print(f"  {entry['file']}:{entry['lineno']} {entry['function']}: "
+                      f"CFG {entry['complexity']}, radon {entry['radon_complexity']}")
+        print(f"Index written to {os.path.join(args.output_dir, 'index.json')} and index.csv")
+        if cfg_cache is not None:
+            print(cfg_cache.format_stats())
+    else:
+        try:
+            tree = ast.parse(code_to_analyze)
+            code_lines = code_to_analyze.splitlines()
+
+            # --- Calculate Cyclomatic Complexity using Radon (on the same AST, no second parse) ---
+            complexity_results = cc_visit_ast(tree)
+            print("\n--- Cyclomatic Complexity (Radon) ---")
+            found_complexity = False
+            for func in complexity_results:
+                if func.name == "analyze_user_behavior":
+                    print(f"Function: {func.name}, Complexity: {func.complexity}")
+                    found_complexity = True
+                    break
+            if not found_complexity:
+                print("Could not find complexity for 'analyze_user_behavior' function.")
+
+
+            # --- Visualize Control Flow Graph ---
+            dot = graphviz.Digraph(comment='Control Flow Graph', graph_attr={'rankdir': 'LR'})
+            visitor = CFGVisitor(dot, code_lines, args.basic_blocks)
+
+            function_found_cfg = False
+            for node in ast.iter_child_nodes(tree):
+                if isinstance(node, ast.FunctionDef) and node.name == "analyze_user_behavior":
+                    visitor.visit_FunctionDef(node)
+                    function_found_cfg = True
+                    if visitor.complexity is not None:
+                        print(f"Function: {node.name}, Complexity from the CFG: "
+                              f"{visitor.complexity + radon_only_decisions(node)}")
+                    break
         
-        if not function_found_cfg:
-            print("Error: 'analyze_user_behavior' function not found for CFG generation.")
-
-        # Explicitly define the output path base name
-        output_filename_base = "user_behavior_cfg_ast" 
+            if not function_found_cfg:
+                print("Error: 'analyze_user_behavior' function not found for CFG generation.")
 
-        # Generate .dot file (Graphviz adds the .dot extension)
-        dot_filepath = os.path.join(os.getcwd(), output_filename_base) # No .dot here
-        dot.render(dot_filepath, view=False, format='dot', cleanup=True)
-        print(f"CFG .dot file generated: {dot_filepath}.dot") # Add .dot for print confirmation
+            # Explicitly define the output path base name
+            output_filename_base = "user_behavior_cfg_ast" 
 
-        # Generate .png image (Graphviz adds the .png extension)
-        png_filepath = os.path.join(os.getcwd(), output_filename_base) # No .png here
-        dot.render(png_filepath, view=False, format='png', cleanup=True)
-        print(f"CFG .png image generated: {png_filepath}.png")
+            # Generate the .dot file and the .png image from one Graphviz layout
+            output_filepath = os.path.join(os.getcwd(), output_filename_base) # No extension here
+            render_formats(dot.source, output_filepath, ['dot', 'png'])
+            print(f"CFG .dot file generated: {output_filepath}.dot")
+            print(f"CFG .png image generated: {output_filepath}.png")
 
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        print("Please ensure your Python code is syntactically correct and Graphviz (system-wide) is installed and in your PATH.")
-        print("Also, ensure 'radon' is installed (`pip install radon`) and 'astunparse' if you are on Python < 3.9.")
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            print("Please ensure your Python code is syntactically correct and Graphviz (system-wide) is installed and in your PATH.")
+            print("Also, ensure 'radon' is installed (`pip install radon`) and 'astunparse' if you are on Python < 3.9.")
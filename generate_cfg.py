@@ -1,20 +1,31 @@
 import ast
 import graphviz
-from pycfg.pycfg import PyCFG, CFGNode
+
+from cfg_backends import build_pycfg_cfg
+from cfg_builder import BRANCH, ENTRY, EXIT, iter_function_nodes
+
+# Node shapes by kind; everything else is a box
+SHAPES = {ENTRY: 'ellipse', EXIT: 'doublecircle', BRANCH: 'diamond'}
+
 
 def generate_cfg_dot(code_string, function_name, output_filename_prefix):
     """
     Generates a Control Flow Graph (CFG) in .dot format for a given Python code string.
 
+    Every function in the code is built with pycfg through cfg_backends.build_pycfg_cfg (the
+    'pycfg' backend of cfg_backends' compare mode) and drawn in one graph.
+
     Args:
         code_string (str): The Python code as a string.
         function_name (str): The name of the function to analyze (for graph title).
         output_filename_prefix (str): Prefix for the output .dot file (e.g., "my_function_cfg").
+
+    Returns:
+        str | None: The path of the .dot file, or None if the CFG could not be generated.
     """
     try:
-        # Build the CFG using pycfg
-        cfg = PyCFG()
-        cfg.build_from_src(code_string)
+        tree = ast.parse(code_string)
+        code_lines = code_string.splitlines()
 
         # Create a Digraph object from graphviz
         dot = graphviz.Digraph(comment=f'CFG for {function_name}')
@@ -23,37 +34,27 @@ def generate_cfg_dot(code_string, function_name, output_filename_prefix):
                  label=f'Control Flow Graph for "{function_name}"',
                  fontsize='20')
 
-        # Add nodes to the graph
-        for node_id, node in cfg.nodes.items():
-            # Clean up the block text for display
-            label = node.block.replace(';', '\\n').strip()
-            if not label: # Handle empty blocks
-                label = f"Node {node_id}"
-
-            # Assign a shape based on node type (optional, but makes it clearer)
-            shape = 'box'
-            if node.is_entry:
-                shape = 'ellipse'
-            elif node.is_exit:
-                shape = 'doublecircle'
-            elif node.is_decision: # Nodes with multiple successors (e.g., if, while)
-                shape = 'diamond'
-
-            dot.node(str(node_id), label, shape=shape, style='rounded', fontname='Inter')
-
-        # Add edges to the graph
-        for node_id, node in cfg.nodes.items():
-            for successor_id in node.successors:
-                dot.edge(str(node_id), str(successor_id))
+        for index, (_, func_node) in enumerate(iter_function_nodes(tree)):
+            if not isinstance(func_node, ast.FunctionDef):  # pycfg only handles plain 'def' functions
+                continue
+            graph = build_pycfg_cfg(func_node, code_lines)
+            # Node ids are prefixed with the function's index, so several functions share one graph
+            for node, kind in enumerate(graph.kinds):
+                label = graph.label(node).strip() or f"Node {node}"
+                dot.node(f"{index}_{node}", label, shape=SHAPES.get(kind, 'box'), style='rounded', fontname='Inter')
+            for source, target in zip(graph.edge_src, graph.edge_dst):
+                dot.edge(f"{index}_{source}", f"{index}_{target}")
 
-        # Render the graph to a .dot file
+        # Write the .dot source; no Graphviz executable is needed for that
         dot_filepath = f"{output_filename_prefix}.dot"
-        dot.render(dot_filepath, view=False, format='dot', cleanup=True) # cleanup=True removes intermediate files
+        dot.save(dot_filepath)
         print(f"CFG .dot file generated: {dot_filepath}")
+        return dot_filepath
 
     except Exception as e:
         print(f"An error occurred during CFG generation: {e}")
-        print("Please ensure your Python code is syntactically correct and Graphviz is installed and in your PATH.")
+        print("Please ensure your Python code is syntactically correct and pycfg is installed.")
+        return None
 
 # --- Your Python code to analyze ---
 # It's important to provide the exact function code here
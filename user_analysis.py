@@ -1,21 +1,34 @@
+# Rule constants, shared by every implementation of the analysis (user_batch, user_records,
+# user_rules) and by the benchmark workloads. A field is over a threshold when it is strictly greater.
+LOGIN_ATTEMPTS_THRESHOLD = 5
+WATCHED_IPS = ('192.168.1.1', '10.0.0.5')
+# last_login_time is an ISO-8601 string; logins before this date are stale
+STALE_LOGIN_BEFORE = '2025-07-20'
+TRUSTED_BROWSERS = ('Chrome', 'Firefox')
+ACCESS_LEVEL_THRESHOLD = 5
+DOWNLOADS_THRESHOLD = 100
+SHARED_LINKS_THRESHOLD = 10
+ALERTS_THRESHOLD = 2
+
+
 def analyze_user_behavior(users):
     suspicious_users = []
     for user in users:
-        if user['login_attempts'] > 5 or user['ip'] in ['192.168.1.1', '10.0.0.5']:
+        if user['login_attempts'] > LOGIN_ATTEMPTS_THRESHOLD or user['ip'] in WATCHED_IPS:
             if user['location'] != 'home':
-                if user['last_login_time'] < '2025-07-20':
+                if user['last_login_time'] < STALE_LOGIN_BEFORE:
                     suspicious_users.append(user)
                 elif user['account_status'] == 'suspended':
                     continue
                 else:
-                    if user['browser'] not in ['Chrome', 'Firefox']:
+                    if user['browser'] not in TRUSTED_BROWSERS:
                         suspicious_users.append(user)
                     else:
                         if 'vpn' in user.get('tags', []):
                             suspicious_users.append(user)
             elif user['location'] == 'office':
-                if user['access_level'] > 5:
-                    if user['downloads'] > 100 and user['shared_links'] > 10:
+                if user['access_level'] > ACCESS_LEVEL_THRESHOLD:
+                    if user['downloads'] > DOWNLOADS_THRESHOLD and user['shared_links'] > SHARED_LINKS_THRESHOLD:
                         suspicious_users.append(user)
         else:
             if user['account_status'] == 'active':
@@ -24,6 +37,6 @@ def analyze_user_behavior(users):
                         if action['type'] == 'delete' and action['scope'] == 'global':
                             suspicious_users.append(user)
                         elif action['type'] == 'login' and action['success'] is False:
-                            if user['alerts'] > 2:
+                            if user['alerts'] > ALERTS_THRESHOLD:
                                 suspicious_users.append(user)
-    return suspicious_users
\ No newline at end of file
+    return suspicious_users
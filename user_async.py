@@ -0,0 +1,491 @@
+import argparse
+import asyncio
+import collections
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from user_analysis import analyze_user_behavior
+from user_stream import EMIT_MODES
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_BATCH_WINDOW = 0.05
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_POLL_INTERVAL = 0.1
+READ_SIZE = 64 * 1024
+# Longest accepted line from a socket or pipe
+LINE_LIMIT = 16 * 1024 * 1024
+# Batch latencies kept for the percentiles
+LATENCY_WINDOW = 10000
+# Queued after the last record; a private object, as any JSON value (even null) can be a record
+_END_OF_INPUT = object()
+
+
+def _split_lines(buffer, chunk):
+    """Appends a chunk to the buffered partial line; returns (complete lines, new partial line)."""
+    *lines, rest = (buffer + chunk).split(b'\n')
+    return lines, rest
+
+
+async def tail_lines(path, follow=True, poll_interval=DEFAULT_POLL_INTERVAL, from_end=False):
+    """
+    Yields the lines of a file, then waits for more like `tail -F`.
+
+    Rotation is detected by the path pointing to a new file (rename or delete and recreate):
+    the old file is read to its end first, then the new one is read from its start. A file
+    truncated in place (copytruncate) is read again from its start. A line is only yielded once
+    its newline is written, except at the end of a file that is not followed.
+
+    Args:
+        path (str | os.PathLike): The file; it may not exist yet when following.
+        follow (bool): Keep waiting for new data; False stops at the end of the file.
+        poll_interval (float): Seconds between checks for new data or a rotation.
+        from_end (bool): Skip what the file holds when it is first opened.
+
+    Yields:
+        bytes: One line, without the newline. Blank lines are skipped.
+    """
+    f = None
+    buffer = b''
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path, 'rb')
+                except FileNotFoundError:
+                    if not follow:
+                        return
+                    await asyncio.sleep(poll_interval)
+                    continue
+                if from_end:
+                    f.seek(0, os.SEEK_END)
+                    from_end = False
+            chunk = f.read(READ_SIZE)
+            if chunk:
+                lines, buffer = _split_lines(buffer, chunk)
+                for line in lines:
+                    if line.strip():
+                        yield line
+                continue
+            if not follow:
+                if buffer.strip():
+                    yield buffer
+                return
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stat = None
+            if stat is None or stat.st_ino != os.fstat(f.fileno()).st_ino:  # Rotated, and the old file is done
+                if buffer.strip():
+                    yield buffer
+                f.close()
+                f, buffer = None, b''
+                continue
+            if stat.st_size < f.tell():  # Truncated in place
+                f.seek(0)
+                buffer = b''
+                continue
+            await asyncio.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
+
+
+async def reader_lines(reader):
+    """Yields the non-blank lines of an asyncio.StreamReader until EOF."""
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        line = line.rstrip(b'\r\n')
+        if line.strip():
+            yield line
+
+
+async def unix_socket_lines(path, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Listens on a Unix socket and yields the lines written by every client, until cancelled.
+
+    Clients connect at any time and send JSONL; their lines are interleaved as they arrive. When
+    the consumer falls behind, the connections stop being read, so the clients block in their
+    writes. The socket file is replaced if it exists and removed at the end.
+    """
+    lines = asyncio.Queue(maxsize=queue_size)
+
+    async def handle(reader, writer):
+        try:
+            async for line in reader_lines(reader):
+                await lines.put(line)
+        except (ConnectionError, ValueError):  # ValueError: a line over LINE_LIMIT
+            pass
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.remove(path)
+    server = await asyncio.start_unix_server(handle, path, limit=LINE_LIMIT)
+    try:
+        while True:
+            yield await lines.get()
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def stdin_lines(stream=None):
+    """
+    Yields the lines of stdin (or another binary file object) until EOF.
+
+    Pipes and terminals are read by the event loop; a regular file redirected to stdin cannot
+    be, so it is read in a worker thread instead.
+    """
+    stream = stream or sys.stdin.buffer
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=LINE_LIMIT)
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), stream)
+    except (ValueError, OSError):
+        buffer = b''
+        while True:
+            chunk = await asyncio.to_thread(stream.read, READ_SIZE)
+            if not chunk:
+                break
+            lines, buffer = _split_lines(buffer, chunk)
+            for line in lines:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+        return
+    async for line in reader_lines(reader):
+        yield line
+
+
+def analyze_batch(records, analyze=analyze_user_behavior, distinct=False):
+    """
+    Runs the analysis on one micro-batch; the unit of work sent to the executor.
+
+    Returns:
+        list: The flagged users in input order, once per append made by the analysis (once per
+        user with `distinct`).
+    """
+    flagged = analyze(records)
+    if distinct:
+        seen = set()
+        flagged = [user for user in flagged if not (id(user) in seen or seen.add(id(user)))]
+    return flagged
+
+
+def analyze_each(records, analyze=analyze_user_behavior, distinct=False):
+    """
+    Runs the analysis record by record, skipping the records it fails on.
+
+    The fallback for a batch whose analysis raised: one malformed record (say, a missing field)
+    costs only its own verdict instead of the whole batch's.
+
+    Returns:
+        tuple: (flagged users in input order, as analyze_batch, number of records skipped).
+    """
+    flagged = []
+    failed = 0
+    for record in records:
+        try:
+            flagged.extend(analyze_batch([record], analyze, distinct))
+        except Exception:
+            failed += 1
+    return flagged, failed
+
+
+class JsonlSink:
+    """Writes every flagged user (or its id) as one line to a text stream, flushed per batch."""
+
+    def __init__(self, stream=None, emit='user', id_field='id'):
+        if emit not in ('user', 'id'):
+            raise ValueError(f"emit must be 'user' or 'id', got {emit!r}")
+        self.stream = stream or sys.stdout
+        self.emit = emit
+        self.id_field = id_field
+
+    def __call__(self, flagged):
+        if self.emit == 'user':
+            lines = [json.dumps(user) for user in flagged]
+        else:
+            lines = [str(user[self.id_field]) for user in flagged]
+        if lines:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+
+
+class PipelineMetrics:
+    """Counters of one pipeline run, see UserPipeline.metrics."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.records = collections.Counter()
+        self.errors = collections.Counter()
+        self.batches = 0
+        self.flagged = 0
+        self.max_queue_depth = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.analysis_seconds = 0.0
+
+    def snapshot(self, queue_depth):
+        elapsed = time.perf_counter() - self.started
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            return latencies[min(int(fraction * len(latencies)), len(latencies) - 1)] if latencies else 0.0
+
+        records = sum(self.records.values())
+        return {
+            'seconds': elapsed,
+            'records': records,
+            'records_per_second': records / elapsed if elapsed else 0.0,
+            'errors': sum(self.errors.values()),
+            'flagged': self.flagged,
+            'queue_depth': queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'batches': self.batches,
+            'batch_latency_p50': percentile(0.5),
+            'batch_latency_p99': percentile(0.99),
+            'batch_latency_max': latencies[-1] if latencies else 0.0,
+            'analysis_seconds': self.analysis_seconds,
+            'sources': {name: {'records': count, 'errors': self.errors[name]} for name, count in self.records.items()},
+        }
+
+
+def format_metrics(metrics):
+    """Formats a UserPipeline.metrics() snapshot as a short report."""
+    lines = [f"--- {metrics['records']} records in {metrics['seconds']:.2f}s "
+             f"({metrics['records_per_second']:,.0f} records/s), {metrics['flagged']} flagged, "
+             f"{metrics['errors']} bad lines; queue {metrics['queue_depth']} (max {metrics['max_queue_depth']}); "
+             f"{metrics['batches']} batches, latency p50 {metrics['batch_latency_p50'] * 1000:.1f} ms, "
+             f"p99 {metrics['batch_latency_p99'] * 1000:.1f} ms, max {metrics['batch_latency_max'] * 1000:.1f} ms ---"]
+    for name, source in sorted(metrics['sources'].items()):
+        lines.append(f"{name}: {source['records']} records, {source['errors']} bad lines")
+    return "\n".join(lines)
+
+
+class UserPipeline:
+    """
+    Reads user records from several sources at once and streams the verdicts to a sink.
+
+    Every source is an async iterator of JSONL lines (see tail_lines, unix_socket_lines,
+    stdin_lines); one task per source decodes its lines into a bounded queue, so a source that
+    outpaces the analysis waits instead of filling memory. A batcher cuts the queue into
+    micro-batches of up to `batch_size` records, or whatever arrived within `batch_window`
+    seconds of a batch's first record. Up to `max_in_flight` batches are analyzed at once in
+    `executor` while the next batch is being collected, and the flagged users of each batch are
+    passed to `sink` (a callable; it may return an awaitable) in batch order. A batch whose
+    analysis raises is analyzed again record by record (see analyze_each); the records that
+    still fail are counted in the 'analysis' errors.
+
+    Use a ProcessPoolExecutor to run the analysis beside the event loop instead of sharing its
+    GIL, with `max_in_flight` set to its number of processes; `analyze` must then be picklable
+    (a module-level function).
+    """
+
+    def __init__(self, sink=None, analyze=analyze_user_behavior, batch_size=DEFAULT_BATCH_SIZE,
+                 batch_window=DEFAULT_BATCH_WINDOW, queue_size=DEFAULT_QUEUE_SIZE, executor=None, distinct=False,
+                 max_in_flight=1):
+        self.sink = sink or JsonlSink()
+        self.analyze = analyze
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.queue_size = queue_size
+        self.executor = executor
+        self.distinct = distinct
+        self.max_in_flight = max_in_flight
+        self.queue = None
+        self.stats = PipelineMetrics()
+
+    def metrics(self):
+        """
+        Current metrics: 'records' and 'records_per_second' (ingest rate since the start),
+        'queue_depth' and 'max_queue_depth', 'batches', 'batch_latency_p50' / 'p99' / 'max'
+        (seconds from a batch's first record entering the queue to its verdicts leaving the
+        sink), 'flagged', 'errors' (lines that are not a JSON object, plus records the analysis
+        failed on) and per-source counts in 'sources'.
+        """
+        return self.stats.snapshot(self.queue.qsize() if self.queue is not None else 0)
+
+    async def _feed(self, name, lines):
+        queue, stats = self.queue, self.stats
+        async for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                stats.errors[name] += 1
+                continue
+            if not isinstance(record, dict):  # Valid JSON, but not a user record
+                stats.errors[name] += 1
+                continue
+            await queue.put((record, time.perf_counter()))
+            stats.records[name] += 1
+            if queue.qsize() > stats.max_queue_depth:
+                stats.max_queue_depth = queue.qsize()
+
+    async def _collect(self, batches):
+        """Cuts the record queue into micro-batches; an _END_OF_INPUT record ends the input."""
+        queue = self.queue
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            record, first_seen = await queue.get()
+            if record is _END_OF_INPUT:
+                break
+            records = [record]
+            deadline = loop.time() + self.batch_window
+            while len(records) < self.batch_size:
+                if queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        record, _ = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    record, _ = queue.get_nowait()
+                if record is _END_OF_INPUT:
+                    done = True
+                    break
+                records.append(record)
+            await batches.put((records, first_seen))
+        await batches.put(None)
+
+    async def _analyze_batch(self, records):
+        """Analyzes one batch in the executor, falling back to one record at a time if it raises."""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            flagged = await loop.run_in_executor(self.executor, analyze_batch, records, self.analyze, self.distinct)
+        except Exception:
+            flagged, failed = await loop.run_in_executor(self.executor, analyze_each, records, self.analyze,
+                                                         self.distinct)
+            self.stats.errors['analysis'] += failed
+        self.stats.analysis_seconds += time.perf_counter() - started
+        return flagged
+
+    async def _analyze(self, batches):
+        stats = self.stats
+        in_flight = collections.deque()
+        getter = None
+        done = False
+        try:
+            while not done or in_flight:
+                if not done and len(in_flight) < self.max_in_flight:
+                    # Take the next batch, unless the oldest one in flight finishes first
+                    if getter is None:
+                        getter = asyncio.ensure_future(batches.get())
+                    waiting = [getter, in_flight[0][0]] if in_flight else [getter]
+                    await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                    if getter.done():
+                        batch, getter = getter.result(), None
+                        if batch is None:
+                            done = True
+                        else:
+                            records, first_seen = batch
+                            in_flight.append((asyncio.ensure_future(self._analyze_batch(records)), first_seen))
+                        continue
+                # Oldest first, so the sink sees the batches in order
+                future, first_seen = in_flight.popleft()
+                flagged = await future
+                result = self.sink(flagged)
+                if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+                    await result
+                stats.batches += 1
+                stats.flagged += len(flagged)
+                stats.latencies.append(time.perf_counter() - first_seen)
+        finally:
+            for future in ([getter] if getter is not None else []) + [future for future, _ in in_flight]:
+                future.cancel()
+
+    async def run(self, sources, metrics_interval=None, on_metrics=None):
+        """
+        Runs until every source is exhausted (or the run is cancelled), then drains the queue.
+
+        Args:
+            sources (dict): Source name -> async iterator of lines.
+            metrics_interval (float | None): Call on_metrics(self.metrics()) this often.
+            on_metrics (callable | None): Receives the periodic metrics.
+
+        Returns:
+            dict: The final metrics.
+        """
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.stats = PipelineMetrics()
+        batches = asyncio.Queue(maxsize=self.max_in_flight + 1)  # Batches analyzed while the next is collected
+        collector = asyncio.create_task(self._collect(batches))
+        analyzer = asyncio.create_task(self._analyze(batches))
+        reporter = None
+        if metrics_interval and on_metrics is not None:
+            async def report():
+                while True:
+                    await asyncio.sleep(metrics_interval)
+                    on_metrics(self.metrics())
+            reporter = asyncio.create_task(report())
+        feeders = [asyncio.create_task(self._feed(name, lines)) for name, lines in sources.items()]
+        try:
+            await asyncio.gather(*feeders)
+            await self.queue.put((_END_OF_INPUT, None))
+            await asyncio.gather(collector, analyzer)
+        finally:
+            tasks = feeders + [collector, analyzer] + ([reporter] if reporter else [])
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for lines in sources.values():
+                if hasattr(lines, 'aclose'):  # Closes files and sockets of unfinished sources
+                    await lines.aclose()
+        return self.metrics()
+
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze user records from files, Unix sockets and stdin as they arrive.")
+    parser.add_argument('--file', action='append', default=[], help="JSONL file to tail (rotation-aware); repeatable")
+    parser.add_argument('--socket', action='append', default=[], help="Unix socket path to listen on; repeatable")
+    parser.add_argument('--stdin', action='store_true', help="also read JSONL from stdin")
+    parser.add_argument('--no-follow', action='store_true', help="stop at the end of the files instead of tailing them")
+    parser.add_argument('--from-end', action='store_true', help="only read what is appended to the files from now on")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="records per micro-batch at most")
+    parser.add_argument('--batch-window', type=float, default=DEFAULT_BATCH_WINDOW,
+                        help="seconds a micro-batch waits for more records after its first one")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help="records buffered before sources wait")
+    parser.add_argument('--processes', type=int, default=0,
+                        help="analyze up to this many batches at once in a process pool (0 = one thread)")
+    parser.add_argument('--emit', choices=[mode for mode in EMIT_MODES if mode != 'offset'], default='user')
+    parser.add_argument('--id-field', default='id')
+    parser.add_argument('--distinct', action='store_true', help="emit each flagged user once per batch")
+    parser.add_argument('--metrics-interval', type=float, default=5.0, help="seconds between metrics reports on stderr")
+    args = parser.parse_args()
+
+    sources = {}
+    for path in args.file:
+        sources[f"file:{path}"] = tail_lines(path, follow=not args.no_follow, from_end=args.from_end)
+    for path in args.socket:
+        sources[f"socket:{path}"] = unix_socket_lines(path)
+    if args.stdin:
+        sources['stdin'] = stdin_lines()
+    if not sources:
+        parser.error("no sources given (use --file, --socket and/or --stdin)")
+
+    executor = ProcessPoolExecutor(args.processes) if args.processes else ThreadPoolExecutor(1)
+    pipeline = UserPipeline(JsonlSink(emit=args.emit, id_field=args.id_field), batch_size=args.batch_size,
+                            batch_window=args.batch_window, queue_size=args.queue_size, executor=executor,
+                            distinct=args.distinct, max_in_flight=max(args.processes, 1))
+
+    def print_metrics(metrics):
+        print(format_metrics(metrics), file=sys.stderr)
+
+    try:
+        final = asyncio.run(pipeline.run(sources, args.metrics_interval, print_metrics))
+        print_metrics(final)
+    except KeyboardInterrupt:
+        print_metrics(pipeline.metrics())
+    finally:
+        executor.shutdown()
@@ -0,0 +1,140 @@
+import numpy as np
+
+from user_analysis import ALERTS_THRESHOLD, LOGIN_ATTEMPTS_THRESHOLD, STALE_LOGIN_BEFORE, TRUSTED_BROWSERS, WATCHED_IPS
+
+STALE_LOGIN_BEFORE_DATE = np.datetime64(STALE_LOGIN_BEFORE)
+
+NUMERIC_FIELDS = ('login_attempts', 'access_level', 'downloads', 'shared_links', 'alerts')
+CATEGORICAL_FIELDS = ('ip', 'location', 'browser', 'account_status')
+
+
+def _category_mask(column, values):
+    """
+    Evaluates `column in values` for a categorical column.
+
+    Args:
+        column (tuple): A (codes, categories) pair. `codes` is an integer array indexing into `categories`.
+        values (iterable): The category values that should match.
+
+    Returns:
+        numpy.ndarray: Boolean mask with one entry per code.
+    """
+    codes, categories = column
+    codes = np.asarray(codes)
+    wanted = set(values)
+    # Compare against the few matching codes; much cheaper than a lookup-table gather
+    mask = np.zeros(codes.shape, dtype=bool)
+    for code, category in enumerate(categories):
+        if category in wanted:
+            mask |= codes == code
+    return mask
+
+
+def _segment_sums(mask, offsets):
+    """Counts the True entries of a flat action mask between consecutive offsets."""
+    hits = np.zeros(len(mask) + 1, dtype=np.int64 if len(mask) >= 2**31 else np.int32)
+    np.cumsum(mask, out=hits[1:])
+    return np.diff(hits[offsets])
+
+
+def _encode(values):
+    """Turns a list of values into a (codes, categories) pair."""
+    categories = {}
+    codes = np.fromiter((categories.setdefault(value, len(categories)) for value in values),
+                        dtype=np.int32, count=len(values))
+    return codes, list(categories)
+
+
+def columns_from_users(users):
+    """
+    Converts a list of user dicts into the columnar layout used by analyze_user_behavior_batch.
+
+    Missing fields get neutral defaults (0, None, no tags, no actions), so the batch
+    result matches analyze_user_behavior for every record the original can process.
+
+    Args:
+        users (list): User dicts in the format accepted by analyze_user_behavior.
+
+    Returns:
+        dict: Column name -> numpy array (or (codes, categories) pair for categorical fields).
+    """
+    columns = {}
+    for field in NUMERIC_FIELDS:
+        columns[field] = np.array([user.get(field, 0) for user in users])
+    for field in CATEGORICAL_FIELDS:
+        columns[field] = _encode([user.get(field) for user in users])
+    columns['last_login_time'] = np.array(
+        [user.get('last_login_time') or 'NaT' for user in users], dtype='datetime64[s]')
+    columns['has_vpn_tag'] = np.array(['vpn' in user.get('tags', []) for user in users], dtype=bool)
+
+    # recent_actions are flattened into one array per attribute, with per-user offsets
+    offsets = np.zeros(len(users) + 1, dtype=np.int64)
+    action_types, action_scopes, action_failed = [], [], []
+    for i, user in enumerate(users):
+        actions = user.get('recent_actions') or []
+        for action in actions:
+            action_types.append(action.get('type'))
+            action_scopes.append(action.get('scope'))
+            action_failed.append(action.get('success') is False)
+        offsets[i + 1] = offsets[i] + len(actions)
+    columns['action_offsets'] = offsets
+    columns['action_type'] = _encode(action_types)
+    columns['action_scope'] = _encode(action_scopes)
+    columns['action_failed'] = np.array(action_failed, dtype=bool)
+    return columns
+
+
+def flag_counts_batch(columns):
+    """
+    Evaluates the analyze_user_behavior decision tree for every user at once.
+
+    Args:
+        columns (dict): Columnar user data, see columns_from_users for the layout.
+            `last_login_time` must hold parsed timestamps (datetime64); for ISO-8601
+            strings this gives the same ordering as the string compare in the original.
+
+    Returns:
+        numpy.ndarray: Number of times each user is appended to the suspicious list.
+    """
+    location_home = _category_mask(columns['location'], ['home'])
+    status_active = _category_mask(columns['account_status'], ['active'])
+
+    # Outer condition: many login attempts or a watched IP
+    watched = ((np.asarray(columns['login_attempts']) > LOGIN_ATTEMPTS_THRESHOLD)
+               | _category_mask(columns['ip'], WATCHED_IPS))
+
+    # Branch 1: watched user away from home. Exactly one append when any leaf fires.
+    # The `elif location == 'office'` branch is unreachable (location is 'home' there), so it never flags.
+    stale = np.asarray(columns['last_login_time']) < STALE_LOGIN_BEFORE_DATE
+    suspended = _category_mask(columns['account_status'], ['suspended'])
+    untrusted_browser = ~_category_mask(columns['browser'], TRUSTED_BROWSERS)
+    flagged_away = stale | (~suspended & (untrusted_browser | np.asarray(columns['has_vpn_tag'])))
+    watched_count = (watched & ~location_home & flagged_away).astype(np.int64)
+
+    # Branch 2: active, non-watched users get one append per matching recent action.
+    # The two action rules are mutually exclusive on `type`, so they can be counted separately
+    # and the per-user alerts threshold applied to the failed-login count afterwards.
+    offsets = np.asarray(columns['action_offsets'])
+    global_delete = (_category_mask(columns['action_type'], ['delete'])
+                     & _category_mask(columns['action_scope'], ['global']))
+    failed_login = _category_mask(columns['action_type'], ['login']) & np.asarray(columns['action_failed'])
+    alerted = np.asarray(columns['alerts']) > ALERTS_THRESHOLD
+    action_count = _segment_sums(global_delete, offsets) + alerted * _segment_sums(failed_login, offsets)
+
+    return np.where(watched, watched_count, np.where(status_active, action_count, 0))
+
+
+def analyze_user_behavior_batch(columns):
+    """
+    Columnar equivalent of analyze_user_behavior.
+
+    Args:
+        columns (dict): Columnar user data, see columns_from_users for the layout.
+
+    Returns:
+        numpy.ndarray: Indices of the suspicious users, in input order. A user flagged
+        several times by the recent_actions loop appears that many times, just like
+        in the list returned by analyze_user_behavior.
+    """
+    counts = flag_counts_batch(columns)
+    return np.repeat(np.arange(len(counts)), counts)
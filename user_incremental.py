@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import pickle
+import sys
+
+from user_analysis import analyze_user_behavior
+from user_stream import iter_jsonl_records
+
+SNAPSHOT_VERSION = 1
+DELTA_OPS = ('upsert', 'delete', 'append_actions')
+
+
+class _RecordingUser(dict):
+    """A copy of a user record that remembers which fields the analysis read."""
+
+    def __init__(self, record):
+        super().__init__(record)
+        self.fields_read = set()
+
+    def __getitem__(self, key):
+        self.fields_read.add(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.fields_read.add(key)
+        return super().get(key, default)
+
+
+class IncrementalAnalyzer:
+    """
+    Keeps the last verdict of every user and re-evaluates only the users a change can affect.
+
+    For every user the analyzer stores the record, how many times the analysis flagged it and
+    the set of fields the analysis read to get there. An update that only touches fields outside
+    that set cannot change the verdict, so it is applied without re-running the analysis.
+    """
+
+    def __init__(self, analyze=analyze_user_behavior, id_field='id'):
+        """
+        Args:
+            analyze (callable): Analysis function with the analyze_user_behavior signature.
+            id_field (str): Field that identifies a user in the records and deltas.
+        """
+        self.analyze = analyze
+        self.id_field = id_field
+        self.users = {}
+        self.verdicts = {}
+        self.depends_on = {}
+        self.evaluations = 0
+        self.rejected = []
+
+    @property
+    def suspicious(self):
+        """Ids of the users that are currently flagged."""
+        return [user_id for user_id, count in self.verdicts.items() if count]
+
+    def _analyze_record(self, record):
+        """Runs the analysis on one record; returns (times flagged, fields read)."""
+        recording = _RecordingUser(record)
+        count = len(self.analyze([recording]))
+        self.evaluations += 1
+        return count, frozenset(recording.fields_read)
+
+    def _evaluate(self, user_id):
+        """Runs the analysis for one user and returns (was suspicious, is suspicious)."""
+        count, fields_read = self._analyze_record(self.users[user_id])
+        was = bool(self.verdicts.get(user_id))
+        self.verdicts[user_id] = count
+        self.depends_on[user_id] = fields_read
+        return was, bool(count)
+
+    @staticmethod
+    def _change(user_id, was, now, changes):
+        if was != now:
+            changes.append((user_id, 'suspicious' if now else 'cleared'))
+
+    def load(self, users):
+        """
+        Evaluates a full population, replacing any previous state.
+
+        Args:
+            users (iterable): User records, each with an id in `id_field`.
+
+        Returns:
+            list: (user_id, 'suspicious') for every flagged user.
+        """
+        self.users, self.verdicts, self.depends_on = {}, {}, {}
+        changes = []
+        for user in users:
+            user_id = user[self.id_field]
+            self.users[user_id] = user
+            self._change(user_id, *self._evaluate(user_id), changes)
+        return changes
+
+    def apply(self, deltas):
+        """
+        Applies a batch of changes and re-evaluates the affected users.
+
+        Each delta is checked and its user re-evaluated before it is applied, so a delta that
+        cannot be applied (an unknown op, actions for an unknown user, or a record the analysis
+        fails on, such as a new user missing fields) leaves that user as it was. Such deltas are
+        skipped and listed in `rejected` as (delta, error message); the rest of the batch is
+        still applied.
+
+        Args:
+            deltas (iterable): Dicts with an 'op' and an 'id':
+                {'op': 'upsert', 'id': ..., 'fields': {...}} creates a user or updates some of its fields,
+                {'op': 'delete', 'id': ...} removes a user,
+                {'op': 'append_actions', 'id': ..., 'actions': [...]} extends its recent_actions.
+
+        Returns:
+            list: (user_id, 'suspicious' | 'cleared') for every user whose verdict flipped, in the
+            order the deltas decided them. A user is reported at most once per batch.
+        """
+        self.rejected = []
+        before = {}
+        touched = []
+        for delta in deltas:
+            try:
+                op = delta.get('op')
+                if op not in DELTA_OPS:
+                    raise ValueError(f"Unknown delta op {op!r}, expected one of {DELTA_OPS}")
+                user_id = delta['id']
+                record = self.users.get(user_id)
+                verdict = None
+                if op == 'upsert':
+                    fields = delta.get('fields', {})
+                    if record is None:
+                        record = {self.id_field: user_id}
+                        changed = None
+                    else:
+                        changed = {key for key, value in fields.items() if key not in record or record[key] != value}
+                    record = {**record, **fields}
+                elif op == 'append_actions':
+                    if record is None:
+                        raise KeyError(f"append_actions for unknown user {user_id!r}")
+                    actions = list(record.get('recent_actions') or ()) + list(delta['actions'])
+                    record = {**record, 'recent_actions': actions}
+                    changed = {'recent_actions'}
+                if op != 'delete' and (changed is None or changed & self.depends_on.get(user_id, frozenset())):
+                    verdict = self._analyze_record(record)
+            except Exception as e:  # One bad delta must not lose the rest of the batch
+                self.rejected.append((delta, f"{e.__class__.__name__}: {e}"))
+                continue
+
+            if user_id not in before:
+                before[user_id] = bool(self.verdicts.get(user_id))
+                touched.append(user_id)
+            if op == 'delete':
+                self.users.pop(user_id, None)
+                self.verdicts.pop(user_id, None)
+                self.depends_on.pop(user_id, None)
+                continue
+            self.users[user_id] = record
+            if verdict is not None:
+                self.verdicts[user_id], self.depends_on[user_id] = verdict
+
+        changes = []
+        for user_id in touched:
+            self._change(user_id, before[user_id], bool(self.verdicts.get(user_id)), changes)
+        return changes
+
+    def snapshot(self, path):
+        """Writes the analyzer state to disk atomically (written to a temp file, then renamed)."""
+        state = {'version': SNAPSHOT_VERSION, 'id_field': self.id_field, 'users': self.users,
+                 'verdicts': self.verdicts, 'depends_on': self.depends_on}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def restore(cls, path, analyze=analyze_user_behavior):
+        """
+        Loads an analyzer from a snapshot written by `snapshot`.
+
+        Only load snapshots you wrote yourself: they are pickles.
+        """
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        if state.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {state.get('version')!r} in {path}")
+        analyzer = cls(analyze, state['id_field'])
+        analyzer.users = state['users']
+        analyzer.verdicts = state['verdicts']
+        analyzer.depends_on = state['depends_on']
+        return analyzer
+
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-evaluate users incrementally from a change feed.")
+    parser.add_argument('state', help="snapshot file holding the analyzer state")
+    parser.add_argument('--init', metavar='USERS_JSONL', help="evaluate a full population and start a new state")
+    parser.add_argument('--apply', metavar='DELTAS_JSONL', help="apply a JSONL file of deltas to the saved state")
+    parser.add_argument('--id-field', default='id')
+    args = parser.parse_args()
+
+    if args.init:
+        analyzer = IncrementalAnalyzer(id_field=args.id_field)
+        changes = analyzer.load(record for _, record in iter_jsonl_records(args.init))
+    else:
+        analyzer = IncrementalAnalyzer.restore(args.state)
+        changes = []
+    if args.apply:
+        changes += analyzer.apply(record for _, record in iter_jsonl_records(args.apply))
+
+    for user_id, verdict in changes:
+        print(json.dumps({'id': user_id, 'verdict': verdict}))
+    for delta, error in analyzer.rejected:
+        print(f"Rejected delta {json.dumps(delta)}: {error}", file=sys.stderr)
+    analyzer.snapshot(args.state)
+    print(f"Evaluated {analyzer.evaluations} users, {len(analyzer.suspicious)} suspicious of {len(analyzer.users)}.",
+          file=sys.stderr)
@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from user_stream import EMIT_MODES, iter_suspicious_users
+
+DEFAULT_CHUNK_SIZE = 32 * 1024 * 1024
+
+
+def split_shards(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Splits a JSONL file into byte ranges that start and end on line boundaries.
+
+    Args:
+        path (str | os.PathLike): The JSONL file to split.
+        chunk_size (int): Approximate size of each shard in bytes.
+
+    Returns:
+        list: (start, end) byte ranges covering the whole file, in file order.
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    size = os.path.getsize(path)
+    shards = []
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()  # Move the cut to the end of the line it landed in
+            end = min(f.tell(), size)
+            shards.append((start, end))
+            start = end
+    return shards
+
+
+class _LineCounter:
+    """Wraps a binary file and counts the lines handed out, for the throughput report."""
+
+    def __init__(self, f, end):
+        self.f = f
+        self.offset = 0
+        self.end = end
+        self.lines = 0
+
+    def seek(self, offset):
+        self.f.seek(offset)
+        self.offset = offset
+
+    def __iter__(self):
+        for line in self.f:
+            if self.offset >= self.end:
+                return
+            self.offset += len(line)
+            self.lines += 1
+            yield line
+
+
+def _analyze_shard(task):
+    """Worker entry point: runs the streaming analysis over one byte range."""
+    index, path, start, end, emit, id_field, distinct = task
+    began = time.perf_counter()
+    with open(path, 'rb') as f:
+        reader = _LineCounter(f, end)
+        items = list(iter_suspicious_users(reader, emit=emit, id_field=id_field, distinct=distinct,
+                                           start=start, end=end))
+    elapsed = time.perf_counter() - began
+    return {'index': index, 'items': items, 'records': reader.lines, 'bytes': end - start,
+            'seconds': elapsed, 'pid': os.getpid()}
+
+
+def iter_suspicious_parallel(path, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, ordered=True,
+                             emit='offset', id_field='id', distinct=False, stats=None):
+    """
+    Runs the user analysis over a JSONL file with a process pool, one byte-range shard per task.
+
+    Args:
+        path (str | os.PathLike): The JSONL file to analyze.
+        workers (int | None): Number of worker processes (defaults to the CPU count).
+        chunk_size (int): Approximate shard size in bytes.
+        ordered (bool): Yield results in input order (deterministic). With False, each shard's
+            results are yielded as soon as it finishes, which keeps all workers busy.
+        emit (str): 'user', 'id' or 'offset', see user_stream.iter_suspicious_users.
+            Offsets are the cheapest to send back from the workers.
+        id_field (str): Field holding the user id when emit='id'.
+        distinct (bool): Yield each flagged user once, see user_stream.iter_suspicious_users.
+        stats (dict | None): If given, filled with the run statistics once all shards are done
+            (see format_stats).
+
+    Yields:
+        dict | object | int: One item per flagged user.
+    """
+    if emit not in EMIT_MODES:
+        raise ValueError(f"emit must be one of {EMIT_MODES}, got {emit!r}")
+    workers = workers or os.cpu_count() or 1
+    tasks = [(index, os.fspath(path), start, end, emit, id_field, distinct)
+             for index, (start, end) in enumerate(split_shards(path, chunk_size))]
+
+    began = time.perf_counter()
+    per_worker = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if ordered:
+            results = executor.map(_analyze_shard, tasks)
+        else:
+            results = (future.result() for future in
+                       as_completed([executor.submit(_analyze_shard, task) for task in tasks]))
+        for result in results:
+            worker = per_worker.setdefault(result['pid'], {'shards': 0, 'records': 0, 'bytes': 0, 'seconds': 0.0})
+            worker['shards'] += 1
+            worker['records'] += result['records']
+            worker['bytes'] += result['bytes']
+            worker['seconds'] += result['seconds']
+            yield from result['items']
+
+    if stats is not None:
+        stats['wall_seconds'] = time.perf_counter() - began
+        stats['shards'] = len(tasks)
+        stats['records'] = sum(worker['records'] for worker in per_worker.values())
+        stats['bytes'] = sum(worker['bytes'] for worker in per_worker.values())
+        for worker in per_worker.values():
+            seconds = worker['seconds'] or float('inf')
+            worker['records_per_second'] = worker['records'] / seconds
+            worker['mb_per_second'] = worker['bytes'] / seconds / 1e6
+        stats['workers'] = per_worker
+
+
+def format_stats(stats):
+    """Formats the statistics filled in by iter_suspicious_parallel as a short report."""
+    wall = stats['wall_seconds'] or float('inf')
+    lines = [f"--- Parallel analysis: {stats['records']} records in {stats['shards']} shards, "
+             f"{stats['wall_seconds']:.2f}s ({stats['records'] / wall:,.0f} records/s) ---"]
+    for pid, worker in sorted(stats['workers'].items()):
+        lines.append(f"worker {pid}: {worker['shards']} shards, {worker['records']} records, "
+                     f"{worker['records_per_second']:,.0f} records/s, {worker['mb_per_second']:.1f} MB/s")
+    return "\n".join(lines)
+
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze a JSONL user dump on all cores.")
+    parser.add_argument('source', help="JSONL file with one user record per line")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="shard size in bytes")
+    parser.add_argument('--unordered', action='store_true', help="emit shard results as they finish")
+    parser.add_argument('--emit', choices=EMIT_MODES, default='offset')
+    parser.add_argument('--id-field', default='id')
+    parser.add_argument('--distinct', action='store_true', help="emit each flagged user only once")
+    args = parser.parse_args()
+
+    run_stats = {}
+    for item in iter_suspicious_parallel(args.source, workers=args.workers, chunk_size=args.chunk_size,
+                                         ordered=not args.unordered, emit=args.emit, id_field=args.id_field,
+                                         distinct=args.distinct, stats=run_stats):
+        print(json.dumps(item) if args.emit == 'user' else item)
+    print(format_stats(run_stats), file=sys.stderr)
@@ -0,0 +1,205 @@
+import sys
+from array import array
+
+from user_analysis import (ALERTS_THRESHOLD, LOGIN_ATTEMPTS_THRESHOLD, STALE_LOGIN_BEFORE, TRUSTED_BROWSERS,
+                           WATCHED_IPS)
+from user_stream import iter_jsonl_records
+
+NUMERIC_FIELDS = ('login_attempts', 'access_level', 'downloads', 'shared_links', 'alerts')
+CATEGORICAL_FIELDS = ('ip', 'location', 'browser', 'account_status', 'last_login_time', 'tags')
+ACTION_FIELDS = ('type', 'scope')
+
+# recent_actions[i]['success'] is stored as one of these codes; only `is False` matters to the rules
+SUCCESS_FALSE, SUCCESS_TRUE, SUCCESS_OTHER = 0, 1, 2
+
+
+class Vocabulary:
+    """Interns the distinct values of a categorical field and hands out small integer codes."""
+
+    __slots__ = ('values', 'codes')
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        if isinstance(value, list):
+            value = tuple(value)  # tags are stored as tuples so they can be interned
+        elif isinstance(value, str):
+            value = sys.intern(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def mask(self, predicate):
+        """Evaluates a predicate once per distinct value; index the result with a code."""
+        return [predicate(value) for value in self.values]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class UserStore:
+    """
+    Struct-of-arrays store for user records.
+
+    Numeric fields live in typed arrays (64-bit integers, switched to doubles for a field once
+    one of its values is a float), categorical fields (ip, location, browser, account_status,
+    last_login_time and the tags list) as codes into per-field vocabularies, and every user's
+    recent_actions as a slice of flat action arrays delimited by `action_offsets`. Only the fields
+    analyze_user_behavior reads are kept, plus the user id. Missing categorical fields are
+    stored as None; every numeric field is required.
+    """
+
+    def __init__(self, id_field='id'):
+        self.id_field = id_field
+        self.ids = []
+        self.numeric = {field: array('q') for field in NUMERIC_FIELDS}
+        self.categorical = {field: array('i') for field in CATEGORICAL_FIELDS}
+        self.vocabularies = {field: Vocabulary() for field in CATEGORICAL_FIELDS}
+        self.action_offsets = array('q', [0])
+        self.action_codes = {field: array('i') for field in ACTION_FIELDS}
+        self.action_vocabularies = {field: Vocabulary() for field in ACTION_FIELDS}
+        self.action_success = array('b')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, user):
+        """
+        Adds one user dict to the store and returns its index.
+
+        Raises:
+            KeyError: A numeric field is missing.
+            TypeError: A numeric field is not a number (e.g. None), which analyze_user_behavior
+                cannot compare either.
+        """
+        numbers = [user[field] for field in NUMERIC_FIELDS]
+        for field, value in zip(NUMERIC_FIELDS, numbers):
+            if not isinstance(value, (int, float)):
+                raise TypeError(f"{field} must be a number, got {value!r}")
+            if isinstance(value, float) and self.numeric[field].typecode == 'q':
+                self.numeric[field] = array('d', self.numeric[field])
+        self.ids.append(user.get(self.id_field))
+        for field, value in zip(NUMERIC_FIELDS, numbers):
+            self.numeric[field].append(value)
+        for field, column in self.categorical.items():
+            column.append(self.vocabularies[field].code(user.get(field)))
+        actions = user.get('recent_actions') or ()
+        for action in actions:
+            for field, column in self.action_codes.items():
+                column.append(self.action_vocabularies[field].code(action.get(field)))
+            success = action.get('success')
+            self.action_success.append(SUCCESS_FALSE if success is False
+                                       else SUCCESS_TRUE if success is True else SUCCESS_OTHER)
+        self.action_offsets.append(self.action_offsets[-1] + len(actions))
+        return len(self.ids) - 1
+
+    def record(self, index):
+        """
+        Rebuilds the user dict at `index`.
+
+        Only the stored fields come back, missing categorical ones as None, numbers of a field
+        that also holds floats as floats, and action `success` values other than True / False
+        as None.
+        """
+        user = {self.id_field: self.ids[index]}
+        for field, column in self.numeric.items():
+            user[field] = column[index]
+        for field, column in self.categorical.items():
+            value = self.vocabularies[field].values[column[index]]
+            user[field] = list(value) if isinstance(value, tuple) else value
+        actions = []
+        for k in range(self.action_offsets[index], self.action_offsets[index + 1]):
+            action = {field: self.action_vocabularies[field].values[column[k]]
+                      for field, column in self.action_codes.items()}
+            success = self.action_success[k]
+            action['success'] = False if success == SUCCESS_FALSE else True if success == SUCCESS_TRUE else None
+            actions.append(action)
+        user['recent_actions'] = actions
+        return user
+
+
+def load_users(users, id_field='id'):
+    """
+    Builds a UserStore from an iterable of user dicts.
+
+    Args:
+        users (iterable): User dicts in the format accepted by analyze_user_behavior.
+        id_field (str): Field holding the user id.
+
+    Returns:
+        UserStore: The populated store.
+    """
+    store = UserStore(id_field)
+    for user in users:
+        store.append(user)
+    return store
+
+
+def load_jsonl(source, id_field='id'):
+    """Builds a UserStore from a JSONL file path or file object, one record at a time."""
+    return load_users((record for _, record in iter_jsonl_records(source)), id_field)
+
+
+def analyze_store(store):
+    """
+    Runs the analyze_user_behavior rules directly on a UserStore.
+
+    Every categorical test is evaluated once per distinct value and then looked up by code,
+    so the per-user work is a handful of array reads.
+
+    Args:
+        store (UserStore): The users to analyze.
+
+    Returns:
+        list: Indices of the suspicious users, in input order and with the same duplicates
+        as the list returned by analyze_user_behavior (see store.ids / store.record).
+    """
+    vocab = store.vocabularies
+    watched_ip = vocab['ip'].mask(lambda ip: ip in WATCHED_IPS)
+    at_home = vocab['location'].mask(lambda location: location == 'home')
+    stale = vocab['last_login_time'].mask(lambda time: time is not None and time < STALE_LOGIN_BEFORE)
+    suspended = vocab['account_status'].mask(lambda status: status == 'suspended')
+    active = vocab['account_status'].mask(lambda status: status == 'active')
+    # Browser outside the trusted list or a 'vpn' tag: the last two leaves of the away-from-home branch
+    untrusted = vocab['browser'].mask(lambda browser: browser not in TRUSTED_BROWSERS)
+    vpn = vocab['tags'].mask(lambda tags: 'vpn' in (tags or ()))
+
+    action_vocab = store.action_vocabularies
+    delete_code = action_vocab['type'].codes.get('delete', -1)
+    login_code = action_vocab['type'].codes.get('login', -1)
+    global_code = action_vocab['scope'].codes.get('global', -1)
+
+    numeric = store.numeric
+    categorical = store.categorical
+    action_type = store.action_codes['type']
+    action_scope = store.action_codes['scope']
+    action_success = store.action_success
+    offsets = store.action_offsets
+    alerts = numeric['alerts']
+    login_threshold, alerts_threshold = LOGIN_ATTEMPTS_THRESHOLD, ALERTS_THRESHOLD
+
+    suspicious = []
+    append = suspicious.append
+    for i, login_attempts, ip, location, last_login, status, browser, tags in zip(
+            range(len(store)), numeric['login_attempts'], categorical['ip'], categorical['location'],
+            categorical['last_login_time'], categorical['account_status'], categorical['browser'],
+            categorical['tags']):
+        if login_attempts > login_threshold or watched_ip[ip]:
+            # The original `elif location == 'office'` branch is unreachable and never flags
+            if not at_home[location]:
+                if stale[last_login]:
+                    append(i)
+                elif not suspended[status] and (untrusted[browser] or vpn[tags]):
+                    append(i)
+        elif active[status]:
+            for k in range(offsets[i], offsets[i + 1]):
+                kind = action_type[k]
+                if kind == delete_code and action_scope[k] == global_code:
+                    append(i)
+                elif kind == login_code and action_success[k] == SUCCESS_FALSE and alerts[i] > alerts_threshold:
+                    append(i)
+    return suspicious
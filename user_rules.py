@@ -0,0 +1,297 @@
+import argparse
+import json
+
+from user_analysis import (ACCESS_LEVEL_THRESHOLD, ALERTS_THRESHOLD, DOWNLOADS_THRESHOLD, LOGIN_ATTEMPTS_THRESHOLD,
+                           SHARED_LINKS_THRESHOLD, STALE_LOGIN_BEFORE, TRUSTED_BROWSERS, WATCHED_IPS)
+
+# --- Rule table ---
+# Each rule has a name, a list of conditions that must all hold, and an outcome:
+# 'flag' appends the user to the result, 'skip' decides the user without flagging it.
+#
+# A condition is one of:
+#   (field, op, value)   op in COMPARISONS; `field` is a user field, or 'action.<field>' for a
+#                        field of the current entry of user['recent_actions']
+#   ('any', [cond, ...]) at least one of the conditions holds
+#   ('not', cond)        the condition does not hold
+#
+# Rules are first-match: the first rule whose conditions all hold decides the user.
+# A rule with 'action.' conditions is a per-action rule; its user conditions (the ones before
+# the first 'action.' condition) gate a pass over recent_actions, and the rule fires for every
+# action that satisfies the rest. Consecutive per-action rules with the same gate share one pass,
+# where the first matching rule wins for each action. Once the gate holds the user is decided.
+
+WATCHED = ('any', [('login_attempts', '>', LOGIN_ATTEMPTS_THRESHOLD), ('ip', 'in', WATCHED_IPS)])
+AWAY = ('location', '!=', 'home')
+
+# Same decisions as user_analysis.analyze_user_behavior, branch by branch
+RULES = (
+    {'name': 'stale_login', 'when': [WATCHED, AWAY, ('last_login_time', '<', STALE_LOGIN_BEFORE)], 'then': 'flag'},
+    {'name': 'suspended', 'when': [WATCHED, AWAY, ('account_status', '==', 'suspended')], 'then': 'skip'},
+    {'name': 'untrusted_browser', 'when': [WATCHED, AWAY, ('browser', 'not in', TRUSTED_BROWSERS)],
+     'then': 'flag'},
+    {'name': 'vpn_tag', 'when': [WATCHED, AWAY, ('tags', 'contains', 'vpn')], 'then': 'flag'},
+    # `elif user['location'] == 'office'` only runs when the location is 'home', so this never fires.
+    # It is kept to mirror the original; the compiler drops it as contradictory.
+    {'name': 'office_bulk_sharing',
+     'when': [WATCHED, ('location', '==', 'home'), ('location', '==', 'office'), ('access_level', '>', ACCESS_LEVEL_THRESHOLD),
+              ('downloads', '>', DOWNLOADS_THRESHOLD), ('shared_links', '>', SHARED_LINKS_THRESHOLD)],
+     'then': 'flag'},
+    {'name': 'global_delete',
+     'when': [('not', WATCHED), ('account_status', '==', 'active'),
+              ('action.type', '==', 'delete'), ('action.scope', '==', 'global')],
+     'then': 'flag'},
+    {'name': 'failed_login_with_alerts',
+     'when': [('not', WATCHED), ('account_status', '==', 'active'),
+              ('action.type', '==', 'login'), ('action.success', 'is', False), ('alerts', '>', ALERTS_THRESHOLD)],
+     'then': 'flag'},
+)
+
+COMPARISONS = ('>', '>=', '<', '<=', '==', '!=', 'in', 'not in', 'is', 'is not', 'contains')
+OUTCOMES = ('flag', 'skip')
+
+
+def _is_action_condition(condition):
+    """Tells whether a condition reads a field of the current recent_actions entry."""
+    if condition[0] == 'any':
+        return any(_is_action_condition(c) for c in condition[1])
+    if condition[0] == 'not':
+        return _is_action_condition(condition[1])
+    return condition[0].startswith('action.')
+
+
+def _split_conditions(rule):
+    """Splits a rule's conditions into (user gate, per-action conditions or None)."""
+    for i, condition in enumerate(rule['when']):
+        if _is_action_condition(condition):
+            return list(rule['when'][:i]), list(rule['when'][i:])
+    return list(rule['when']), None
+
+
+def _negated(condition):
+    if condition[0] == 'not':
+        return condition[1]
+    return ('not', condition)
+
+
+def _is_contradictory(conditions):
+    """
+    Finds conditions that can never hold together, so dead rules can be dropped.
+
+    Only catches the simple cases: a condition next to its negation, a field compared
+    `==` to two different constants, or `==` and `!=` to the same constant.
+    """
+    equals = {}
+    not_equals = set()
+    for condition in conditions:
+        if _negated(condition) in conditions:
+            return True
+        if condition[0] in ('any', 'not'):
+            continue
+        field, op, value = condition
+        if op == '==':
+            if field in equals and equals[field] != value:
+                return True
+            equals[field] = value
+        elif op == '!=':
+            not_equals.add((field, value))
+    return any((field, value) in not_equals for field, value in equals.items())
+
+
+class _RuleCompiler:
+    """Turns a rule table into the source of a flat `analyze(users)` function."""
+
+    def __init__(self, exact, explain):
+        self.exact = exact
+        self.explain = explain
+        self.constants = {}
+        self.lines = []
+
+    def constant(self, value):
+        """Returns an expression for a rule constant, binding containers once as frozensets."""
+        if isinstance(value, (list, tuple, set, frozenset)):
+            value = frozenset(value)
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return repr(value)
+        name = f"_k{len(self.constants)}"
+        self.constants[name] = value
+        return name
+
+    def expression(self, condition):
+        if condition[0] == 'any':
+            return '(' + ' or '.join(self.expression(c) for c in condition[1]) + ')'
+        if condition[0] == 'not':
+            return f"not {self.expression(condition[1])}"
+        field, op, value = condition
+        if op not in COMPARISONS:
+            raise ValueError(f"Unknown comparison {op!r} in condition {condition!r}")
+        if field.startswith('action.'):
+            source, field = 'action', field[len('action.'):]
+        else:
+            source = 'user'
+        if op == 'contains':
+            return f"{self.constant(value)} in {source}.get({field!r}, ())"
+        return f"{source}[{field!r}] {op} {self.constant(value)}"
+
+    def emit(self, depth, line):
+        self.lines.append('    ' * depth + line)
+
+    def emit_outcome(self, depth, rule, per_action=False):
+        if rule['then'] == 'flag':
+            item = f"(user, {rule['name']!r})" if self.explain else 'user'
+            self.emit(depth, f"append({item})")
+        if not per_action:
+            self.emit(depth, 'continue')
+        elif not self.exact or rule['then'] == 'skip':
+            # Early exit: the user is decided at its first matching action
+            self.emit(depth, 'break')
+
+    def compile_rules(self, entries, depth):
+        """
+        Emits first-match code for (gate, per-action conditions, rule) entries.
+
+        Consecutive entries that share their leading gate condition are nested under one
+        `if`, so each condition is evaluated once per user; a group whose condition is the
+        negation of the previous group's becomes its `else` branch.
+        """
+        previous = None
+        i = 0
+        while i < len(entries):
+            gate, actions, rule = entries[i]
+            if not gate:
+                # Per-action rules sharing this (now empty) gate form one pass over recent_actions
+                j = i
+                while j < len(entries) and not entries[j][0] and entries[j][1] is not None:
+                    j += 1
+                if j == i:
+                    self.emit_outcome(depth, rule)
+                    return  # Nothing after an unconditional rule can fire
+                self.compile_action_pass(entries[i:j], depth)
+                return
+            head = gate[0]
+            j = i
+            while j < len(entries) and entries[j][0] and entries[j][0][0] == head:
+                j += 1
+            keyword = 'else:' if previous is not None and head == _negated(previous) else None
+            self.emit(depth, keyword or f"if {self.expression(head)}:")
+            self.compile_rules([(g[1:], a, r) for g, a, r in entries[i:j]], depth + 1)
+            previous = None if keyword else head
+            i = j
+
+    def compile_action_pass(self, entries, depth):
+        self.emit(depth, "actions = user['recent_actions']")
+        self.emit(depth, 'if actions:')
+        self.emit(depth + 1, 'for action in actions:')
+        for k, (_, actions, rule) in enumerate(entries):
+            test = ' and '.join(self.expression(c) for c in actions)
+            self.emit(depth + 2, f"{'if' if k == 0 else 'elif'} {test}:")
+            self.emit_outcome(depth + 3, rule, per_action=True)
+        self.emit(depth, 'continue')
+
+    def compile(self, rules):
+        entries = []
+        for rule in rules:
+            if rule['then'] not in OUTCOMES:
+                raise ValueError(f"Rule {rule['name']!r} has unknown outcome {rule['then']!r}")
+            gate, actions = _split_conditions(rule)
+            if _is_contradictory(rule['when']):
+                continue
+            entries.append((gate, actions, rule))
+
+        self.emit(0, 'def analyze(users):')
+        self.emit(1, 'suspicious_users = []')
+        self.emit(1, 'append = suspicious_users.append')
+        self.emit(1, 'for user in users:')
+        if entries:
+            self.compile_rules(entries, 2)
+        else:
+            self.emit(2, 'pass')
+        self.emit(1, 'return suspicious_users')
+        return '\n'.join(self.lines) + '\n'
+
+
+def rules_source(rules=RULES, exact=True, explain=False):
+    """
+    Generates the Python source of the function compile_rules would build.
+
+    Args:
+        rules (sequence): The rule table, see RULES.
+        exact (bool): Reproduce analyze_user_behavior exactly, including one append per matching
+            recent action. With False a user is appended at most once (first matching rule wins).
+        explain (bool): Append (user, rule_name) pairs instead of bare users.
+
+    Returns:
+        tuple: (source, constants) where constants are the names the source expects in scope.
+    """
+    compiler = _RuleCompiler(exact, explain)
+    source = compiler.compile(rules)
+    return source, compiler.constants
+
+
+def compile_rules(rules=RULES, exact=True, explain=False):
+    """
+    Compiles a rule table into a flat `analyze(users)` function.
+
+    The generated function walks the users once, evaluates each shared condition once per user
+    (membership tests against frozensets bound at compile time), stops at the first rule that
+    decides a user and skips rules that can never fire.
+
+    Args:
+        rules (sequence): The rule table, see RULES.
+        exact (bool): See rules_source. The default matches analyze_user_behavior append for append.
+        explain (bool): See rules_source.
+
+    Returns:
+        function: analyze(users) -> list of flagged users (or (user, rule_name) pairs).
+    """
+    source, constants = rules_source(rules, exact, explain)
+    namespace = dict(constants)
+    exec(compile(source, '<user_rules>', 'exec'), namespace)
+    analyze = namespace['analyze']
+    analyze.source = source
+    return analyze
+
+
+analyze_user_behavior_compiled = compile_rules(RULES)
+
+
+# Main execution
+if __name__ == "__main__":
+    import gc
+    import time
+
+    from user_analysis import analyze_user_behavior
+    from user_stream import iter_jsonl_records
+
+    parser = argparse.ArgumentParser(description="Compile the suspicious-user rules and check them.")
+    parser.add_argument('--source', action='store_true', help="print the generated function")
+    parser.add_argument('--first-match', action='store_true', help="flag each user at most once")
+    parser.add_argument('--explain', action='store_true', help="record the rule that fired")
+    parser.add_argument('--check', metavar='USERS_JSONL',
+                        help="compare the compiled rules with analyze_user_behavior on a JSONL file")
+    args = parser.parse_args()
+
+    analyze = compile_rules(RULES, exact=not args.first_match, explain=args.explain)
+    if args.source:
+        print(analyze.source)
+    if args.check:
+        users = [record for _, record in iter_jsonl_records(args.check)]
+        gc.disable()  # Keep collector passes over the loaded records out of the timings
+        start = time.perf_counter()
+        expected = analyze_user_behavior(users)
+        reference_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        result = analyze(users)
+        compiled_seconds = time.perf_counter() - start
+        gc.enable()
+        flagged = [item[0] for item in result] if args.explain else result
+        print(f"--- Rule check on {len(users)} users ---")
+        if not args.first_match:
+            print(f"Identical to analyze_user_behavior: {[id(u) for u in flagged] == [id(u) for u in expected]}")
+        print(f"Flagged: {len(flagged)} (reference: {len(expected)})")
+        print(f"Reference: {reference_seconds:.3f}s, compiled: {compiled_seconds:.3f}s, "
+              f"speedup: {reference_seconds / max(compiled_seconds, 1e-9):.2f}x")
+        if args.explain:
+            fired = {}
+            for _, rule_name in result:
+                fired[rule_name] = fired.get(rule_name, 0) + 1
+            print(json.dumps(fired, indent=2))
@@ -0,0 +1,97 @@
+import argparse
+import io
+import json
+import os
+import sys
+
+from user_analysis import analyze_user_behavior
+
+EMIT_MODES = ('user', 'id', 'offset')
+
+
+def iter_jsonl_records(source, start=0, end=None):
+    """
+    Lazily reads user records from a JSONL file, one line at a time.
+
+    Args:
+        source (str | os.PathLike | file-like): Path to the file, or an already open file object.
+            Paths are opened in binary mode so the offsets are byte offsets.
+        start (int): Offset of the first line to read. Must be at a line boundary; the
+            source is seeked there when it is not 0.
+        end (int | None): Stop before the first line that starts at or after this offset.
+
+    Yields:
+        tuple: (offset, record) where offset is the position of the line's first byte
+        (or character, for text streams) and record is the decoded dict. Blank lines are skipped.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield from iter_jsonl_records(f, start, end)
+        return
+
+    if start:
+        source.seek(start)
+    offset = start
+    for line in source:
+        if end is not None and offset >= end:
+            break
+        line_offset = offset
+        offset += len(line)
+        if line.strip():
+            yield line_offset, json.loads(line)
+
+
+def iter_suspicious_users(source, emit='user', id_field='id', distinct=False, start=0, end=None):
+    """
+    Streaming variant of analyze_user_behavior for JSONL input.
+
+    Each record is decided by analyze_user_behavior itself as soon as it is read, so the
+    verdicts are identical and only one record is held in memory at a time.
+
+    Args:
+        source (str | os.PathLike | file-like): JSONL file path or open file object.
+        emit (str): What to yield for a flagged user: 'user' (the dict), 'id' (user[id_field])
+            or 'offset' (byte offset of the record's line, usable with mmap/seek on the source).
+        id_field (str): Field holding the user id when emit='id'.
+        distinct (bool): Yield each flagged user once instead of once per append made by
+            analyze_user_behavior (the recent_actions loop can flag a user several times).
+        start (int): Offset to start reading from, see iter_jsonl_records.
+        end (int | None): Offset to stop reading at, see iter_jsonl_records.
+
+    Yields:
+        dict | object | int: One item per flagged user, in input order.
+    """
+    if emit not in EMIT_MODES:
+        raise ValueError(f"emit must be one of {EMIT_MODES}, got {emit!r}")
+    if emit == 'offset' and isinstance(source, io.TextIOBase):
+        raise ValueError("emit='offset' needs a binary stream or a path, text streams have no byte offsets")
+
+    for offset, user in iter_jsonl_records(source, start, end):
+        flagged = analyze_user_behavior((user,))
+        if not flagged:
+            continue
+        if emit == 'user':
+            item = user
+        elif emit == 'id':
+            item = user[id_field]
+        else:
+            item = offset
+        for _ in range(1 if distinct else len(flagged)):
+            yield item
+
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream suspicious users out of a JSONL dump.")
+    parser.add_argument('source', help="JSONL file with one user record per line ('-' for stdin)")
+    parser.add_argument('--emit', choices=EMIT_MODES, default='user')
+    parser.add_argument('--id-field', default='id')
+    parser.add_argument('--distinct', action='store_true', help="emit each flagged user only once")
+    args = parser.parse_args()
+
+    source = sys.stdin.buffer if args.source == '-' else args.source
+    for item in iter_suspicious_users(source, emit=args.emit, id_field=args.id_field, distinct=args.distinct):
+        if args.emit == 'user':
+            print(json.dumps(item))
+        else:
+            print(item)